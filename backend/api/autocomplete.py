@@ -0,0 +1,74 @@
+import threading
+from bisect import bisect_left
+
+from api import catalog
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+from recipes.models import Ingredient
+
+FIELDS = ('id', 'name', 'measurement_unit')
+
+
+class IngredientIndex:
+    """Отсортированный по названию индекс продуктов в памяти процесса."""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda row: (row['name'].lower(),
+                                                  row['id']))
+        self.keys = [row['name'].lower() for row in self.rows]
+
+    def search(self, query, limit):
+        """Сначала названия, начинающиеся с запроса, затем остальные."""
+        start = bisect_left(self.keys, query)
+        result = []
+        for position in range(start, len(self.keys)):
+            if len(result) == limit or not self.keys[position].startswith(
+                    query):
+                break
+            result.append(self.rows[position])
+        for key, row in zip(self.keys, self.rows):
+            if len(result) == limit:
+                break
+            if query in key and not key.startswith(query):
+                result.append(row)
+        return result
+
+
+_state = {'snapshot': None, 'index': None}
+_lock = threading.Lock()
+
+
+def get_index():
+    """Индекс строится по снимку справочника и живёт столько же, сколько он."""
+    snapshot = catalog.get_snapshot()
+    if _state['snapshot'] is not snapshot:
+        with _lock:
+            if _state['snapshot'] is not snapshot:
+                _state['index'] = IngredientIndex(snapshot.rows)
+                _state['snapshot'] = snapshot
+    return _state['index']
+
+
+def search_database(query, limit):
+    """Поиск по триграммному и префиксному индексам Postgres."""
+    return list(Ingredient.objects.filter(name__icontains=query).annotate(
+        rank=Case(When(name__istartswith=query, then=Value(0)),
+                  default=Value(1), output_field=IntegerField()),
+    ).order_by('rank', 'name').values(*FIELDS)[:limit])
+
+
+def use_database():
+    backend = settings.INGREDIENT_AUTOCOMPLETE_BACKEND
+    if backend == 'auto':
+        return connection.vendor == 'postgresql'
+    return backend == 'database'
+
+
+def search(query, limit=None):
+    """Подсказки продуктов для редактора рецептов."""
+    query = query.strip().lower()
+    limit = limit or settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+    if use_database():
+        return search_database(query, limit)
+    return get_index().search(query, limit)
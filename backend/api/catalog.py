@@ -0,0 +1,49 @@
+import hashlib
+import threading
+
+from django.utils.http import quote_etag
+from recipes.models import Ingredient, Tag
+from recipes.versions import INGREDIENTS, TAGS, get_version
+from rest_framework.renderers import JSONRenderer
+
+
+class CatalogSnapshot:
+    """Сериализованный справочник продуктов одной версии."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = rows
+        self.body = JSONRenderer().render(rows)
+        self.etag = quote_etag(hashlib.sha1(self.body).hexdigest())
+
+
+_state = {'snapshot': None, 'tags': None}
+_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Снимок пересобирается, только когда меняется версия справочника."""
+    version = get_version(INGREDIENTS)
+    snapshot = _state['snapshot']
+    if snapshot is None or snapshot.version != version:
+        with _lock:
+            snapshot = _state['snapshot']
+            if snapshot is None or snapshot.version != version:
+                snapshot = CatalogSnapshot(version, list(
+                    Ingredient.objects.values(
+                        'id', 'name', 'measurement_unit')))
+                _state['snapshot'] = snapshot
+    return snapshot
+
+
+def get_tag_ids():
+    """Id тегов по slug, перечитываются, только когда меняется версия."""
+    version = get_version(TAGS)
+    tags = _state['tags']
+    if tags is None or tags[0] != version:
+        with _lock:
+            tags = _state['tags']
+            if tags is None or tags[0] != version:
+                tags = (version, dict(Tag.objects.values_list('slug', 'id')))
+                _state['tags'] = tags
+    return tags[1]
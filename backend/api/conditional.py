@@ -0,0 +1,72 @@
+import hashlib
+
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import quote_etag
+from recipes.models import Favorite, Recipe, ShoppingCart, Subscribe
+from recipes.versions import INGREDIENTS, TAGS, USERS, get_versions
+from users.models import User
+
+
+def _summary(model):
+    rows = model.objects.filter(user=OuterRef('pk')).order_by().values('user')
+    return (Subquery(rows.annotate(total=Count('id')).values('total')),
+            Subquery(rows.annotate(last=Max('id')).values('last')))
+
+
+def user_state(user):
+    """Число и последний id избранного, корзины и подписок пользователя.
+
+    Любое добавление меняет последний id, любое удаление — число, поэтому
+    этого достаточно, чтобы заметить смену флагов в ответе.
+    """
+    if user.is_anonymous:
+        return ()
+    annotations = {}
+    for model in (Favorite, ShoppingCart, Subscribe):
+        total, last = _summary(model)
+        annotations[f'{model._meta.model_name}_total'] = total
+        annotations[f'{model._meta.model_name}_last'] = last
+    return User.objects.filter(pk=user.pk).annotate(
+        **annotations).values_list(*annotations).first()
+
+
+def recipe_state(user, pk):
+    """Дата изменения рецепта и флаги пользователя для него."""
+    queryset = Recipe.objects.with_user_flags(user)
+    try:
+        return queryset.filter(pk=pk).values_list(
+            'updated_at', *queryset.query.annotations).first()
+    except (TypeError, ValueError):
+        return None
+
+
+def cart_state(user):
+    """Состав корзины и даты изменения рецептов в ней."""
+    state = ShoppingCart.objects.filter(user=user).aggregate(
+        total=Count('id'), last=Max('id'),
+        updated=Max('recipe__updated_at'))
+    return state['total'], state['last'], state['updated']
+
+
+def make_etag(*parts):
+    """ETag по состоянию данных, из которых строится ответ."""
+    # Ответы содержат теги, продукты и данные авторов.
+    parts += get_versions((TAGS, INGREDIENTS, USERS))
+    return quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+
+
+# Last-Modified не отдаётся: ответы зависят от версий тегов, продуктов
+# и авторов, которые не меняют updated_at, а ETag их учитывает.
+def conditional_response(request, etag):
+    """Ответ 304, если у клиента актуальная версия, иначе None."""
+    return get_conditional_response(request, etag=etag)
+
+
+def add_validators(request, response, etag):
+    response['ETag'] = etag
+    if not request.user.is_anonymous:
+        patch_cache_control(response, private=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
@@ -1,29 +1,52 @@
+from api import catalog
 from django_filters import rest_framework as django_filter
-from recipes.models import Recipe
-from rest_framework import filters
+from recipes import search
+from recipes.models import Favorite, Recipe, ShoppingCart, TagRecipe
+
+
+def tag_choices():
+    return [(slug, slug) for slug in catalog.get_tag_ids()]
 
 
 class RecipeFilters(django_filter.FilterSet):
-    """Фильтр для рецептов."""
-    tags = django_filter.AllValuesMultipleFilter(field_name='tags__slug')
+    """Фильтр для рецептов.
+
+    Каждый фильтр сужает тот же набор подзапросом по связям, поэтому
+    фильтры сочетаются, а строки не дублируются и DISTINCT не нужен.
+    """
+    tags = django_filter.MultipleChoiceFilter(
+        choices=tag_choices, method='get_tags')
     is_favorited = django_filter.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = django_filter.BooleanFilter(
         method='get_is_in_shopping_cart')
+    search = django_filter.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
         fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
 
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        tag_ids = catalog.get_tag_ids()
+        return queryset.filter(id__in=TagRecipe.objects.filter(
+            tag_id__in=[tag_ids[slug] for slug in value if slug in tag_ids]
+        ).values('recipe_id'))
+
+    def filter_by_user(self, queryset, model, value):
+        if not value:
+            return queryset
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none()
+        return queryset.filter(id__in=model.objects.filter(
+            user=user).values('recipe_id'))
+
     def get_is_favorited(self, queryset, name, value):
-        if value:
-            return Recipe.objects.filter(favorites__user=self.request.user)
-        return Recipe.objects.all()
+        return self.filter_by_user(queryset, Favorite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return Recipe.objects.filter(carts__user=self.request.user)
-        return Recipe.objects.all()
-
+        return self.filter_by_user(queryset, ShoppingCart, value)
 
-class IngredientSearch(filters.SearchFilter):
-    search_param = 'name'
+    def get_search(self, queryset, name, value):
+        return search.match(queryset, value)
@@ -0,0 +1,186 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from api import shopping_list
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from recipes import images
+from recipes.models import Recipe, ShoppingListJob
+from recipes.versions import RECIPES, bump_on_commit, recipe_version
+
+_executors = {}
+_lock = threading.Lock()
+
+
+def get_executor(workers_setting):
+    """Пул процессов, чтобы reportlab и Pillow не занимали GIL запросов.
+
+    У списков покупок и картинок свои пулы: поток загрузок не задерживает
+    сборку списков.
+    """
+    if workers_setting not in _executors:
+        with _lock:
+            if workers_setting not in _executors:
+                _executors[workers_setting] = ProcessPoolExecutor(
+                    max_workers=getattr(settings, workers_setting),
+                    mp_context=multiprocessing.get_context('spawn'))
+    return _executors[workers_setting]
+
+
+def store_result(job_id, pdf=None, error=''):
+    job = ShoppingListJob.objects.filter(pk=job_id).first()
+    if job is None:
+        # Задание удалено вместе с пользователем или как зависшее.
+        return
+    if pdf is not None:
+        job.file.save(f'{job_id}.pdf', ContentFile(pdf), save=False)
+    job.status = ShoppingListJob.FAILED if error else ShoppingListJob.DONE
+    job.error = error
+    job.finished = timezone.now()
+    job.save(update_fields=('file', 'status', 'error', 'finished'))
+
+
+def job_finished(job_id, future):
+    """Сохраняет результат; вызывается в служебном потоке пула."""
+    close_old_connections()
+    try:
+        error = future.exception()
+        if error is None:
+            store_result(job_id, pdf=future.result())
+        else:
+            store_result(job_id, error=repr(error))
+    finally:
+        connection.close()
+
+
+def start(job, rows):
+    """Отправляет сборку в пул после фиксации транзакции с заданием.
+
+    Возвращает задание; без пула оно уже собрано и перечитано из БД.
+    """
+    rows = list(rows)
+    if not settings.SHOPPING_LIST_WORKERS:
+        store_result(job.pk, pdf=shopping_list.render_pdf(
+            rows, settings.SHOPPING_LIST_FONT))
+        job.refresh_from_db()
+        return job
+
+    def submit():
+        future = get_executor('SHOPPING_LIST_WORKERS').submit(
+            shopping_list.render_pdf, rows, settings.SHOPPING_LIST_FONT)
+        future.add_done_callback(partial(job_finished, job.pk))
+
+    transaction.on_commit(submit)
+    return job
+
+
+def delete_files(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def delete_finished(user):
+    """Удаляет прежние задания пользователя, кроме ещё собираемых.
+
+    Задание в очереди остаётся: пул сохранит его результат. Файлы
+    удаляются после фиксации, иначе откат оставил бы задания без файлов.
+    """
+    deadline = timezone.now() - timedelta(
+        seconds=settings.SHOPPING_LIST_JOB_TIMEOUT)
+    previous = ShoppingListJob.objects.filter(user=user).exclude(
+        status=ShoppingListJob.PENDING, created__gte=deadline)
+    files = [job.file.name for job in previous if job.file]
+    previous.delete()
+    transaction.on_commit(partial(delete_files, files))
+
+
+def expire_stale(job):
+    """Задание, потерянное при перезапуске процесса, помечается ошибкой."""
+    deadline = job.created + timedelta(
+        seconds=settings.SHOPPING_LIST_JOB_TIMEOUT)
+    if job.status == ShoppingListJob.PENDING and timezone.now() > deadline:
+        job.status = ShoppingListJob.FAILED
+        job.error = 'Превышено время ожидания сборки'
+        job.save(update_fields=('status', 'error'))
+    return job
+
+
+def image_variants_args(name):
+    with default_storage.open(name) as file:
+        data = file.read()
+    return (data, settings.RECIPE_IMAGE_VARIANTS,
+            settings.RECIPE_IMAGE_FORMAT, settings.RECIPE_IMAGE_QUALITY)
+
+
+def delete_variants(names):
+    for name in names:
+        for variant in settings.RECIPE_IMAGE_VARIANTS:
+            default_storage.delete(images.variant_name(
+                name, variant, settings.RECIPE_IMAGE_FORMAT))
+
+
+def store_variants(name, rendered):
+    """Сохраняет варианты и отмечает рецепты с этой картинкой."""
+    for variant, data in rendered.items():
+        path = images.variant_name(
+            name, variant, settings.RECIPE_IMAGE_FORMAT)
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        default_storage.save(path, ContentFile(data))
+    # updated_at меняется, чтобы ETag списков отдал новые адреса картинок.
+    rows = list(Recipe.objects.filter(image=name).exclude(
+        image_variants_for=name).values_list('id', 'image_variants_for'))
+    recipes = [recipe for recipe, _ in rows]
+    Recipe.objects.filter(id__in=recipes).update(
+        image_variants_for=name, updated_at=timezone.now())
+    bump_on_commit(RECIPES, *map(recipe_version, recipes))
+    # Варианты прежней картинки удаляются, если она больше нигде не нужна.
+    stale = {previous for _, previous in rows if previous}
+    if stale:
+        in_use = Recipe.objects.filter(
+            Q(image__in=stale) | Q(image_variants_for__in=stale)
+        ).values_list('image', 'image_variants_for')
+        stale -= {used for row in in_use for used in row}
+        transaction.on_commit(partial(delete_variants, stale))
+
+
+def build_variants_now(name):
+    store_variants(name, images.render_variants(*image_variants_args(name)))
+
+
+def variants_finished(name, future):
+    """Сохраняет варианты; при ошибке рецепт остаётся с оригиналом."""
+    close_old_connections()
+    try:
+        if future.exception() is None:
+            store_variants(name, future.result())
+    finally:
+        connection.close()
+
+
+def submit_variants(name):
+    """Без исходного файла или при битой картинке остаётся оригинал."""
+    try:
+        args = image_variants_args(name)
+        if not settings.RECIPE_IMAGE_WORKERS:
+            store_variants(name, images.render_variants(*args))
+            return
+    except (OSError, ValueError):
+        return
+    future = get_executor('RECIPE_IMAGE_WORKERS').submit(
+        images.render_variants, *args)
+    future.add_done_callback(partial(variants_finished, name))
+
+
+def build_variants(recipe):
+    """Готовит варианты новой картинки рецепта вне запроса."""
+    name = recipe.image.name
+    if name and name != recipe.image_variants_for:
+        transaction.on_commit(partial(submit_variants, name))
@@ -0,0 +1,336 @@
+import base64
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from PIL import Image
+from recipes import search
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Subscribe, Tag, TagRecipe)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+PASSWORD = 'benchmark-password'
+
+# Сценарии: имя, метод, адрес, нужна ли авторизация, ожидаемый статус,
+# предел SQL-запросов.
+SCENARIOS = (
+    ('recipes_list_anon', 'get', '/api/recipes/', False, 200, 4),
+    ('recipes_list', 'get', '/api/recipes/', True, 200, 6),
+    ('recipes_list_limit_50', 'get', '/api/recipes/?limit=50', True, 200, 6),
+    ('recipes_list_fields', 'get',
+     '/api/recipes/?limit=50&fields=id,name,image,cooking_time', True, 200, 4),
+    ('recipes_list_cursor_anon', 'get', '/api/recipes/?cursor=', False,
+     200, 5),
+    ('recipes_list_cursor', 'get', '/api/recipes/?cursor=', True, 200, 7),
+    ('recipes_list_author', 'get', '/api/recipes/?author={author}',
+     True, 200, 7),
+    ('recipes_list_tags', 'get',
+     '/api/recipes/?tags={tag}&tags={other_tag}', True, 200, 7),
+    ('recipes_list_favorited', 'get', '/api/recipes/?is_favorited=1',
+     True, 200, 8),
+    ('recipes_list_in_cart', 'get', '/api/recipes/?is_in_shopping_cart=1',
+     True, 200, 8),
+    ('recipes_search', 'get', '/api/recipes/?search=рецепт 12', True, 200, 6),
+    ('recipes_detail', 'get', '/api/recipes/{recipe}/', True, 200, 5),
+    # Создание и замена картинки включают отметку о готовых вариантах
+    # и выбор рецептов, чьи версии в кэше ответов нужно сменить. Любое
+    # сохранение пересобирает документ поиска рецепта.
+    ('recipes_create', 'post', '/api/recipes/', True, 201, 16),
+    ('recipes_update', 'patch', '/api/recipes/{own_recipe}/', True, 200, 18),
+    ('recipes_update_text', 'patch', '/api/recipes/{own_recipe}/',
+     True, 200, 9),
+    ('recipes_delete', 'delete', '/api/recipes/{own_recipe}/', True, 204, 20),
+    ('favorite_add', 'post', '/api/recipes/{recipe}/favorite/', True, 200, 4),
+    ('favorite_remove', 'delete', '/api/recipes/{recipe}/favorite/',
+     True, 200, 5),
+    ('cart_add', 'post', '/api/recipes/{recipe}/shopping_cart/', True, 200, 4),
+    ('cart_remove', 'delete', '/api/recipes/{recipe}/shopping_cart/',
+     True, 200, 4),
+    ('download_shopping_cart', 'get',
+     '/api/recipes/download_shopping_cart/', True, 200, 3),
+    ('download_shopping_cart_txt', 'get',
+     '/api/recipes/download_shopping_cart/?format=txt', True, 200, 2),
+    ('download_shopping_cart_json', 'get',
+     '/api/recipes/download_shopping_cart/?format=json', True, 200, 2),
+    ('subscriptions', 'get', '/api/users/subscriptions/', True, 200, 5),
+    ('subscriptions_recipes_limit', 'get',
+     '/api/users/subscriptions/?recipes_limit=3', True, 200, 5),
+    ('subscriptions_cursor', 'get', '/api/users/subscriptions/?cursor=',
+     True, 200, 4),
+    ('recipes_feed', 'get', '/api/recipes/feed/', True, 200, 6),
+    ('recipes_feed_limit_50', 'get', '/api/recipes/feed/?limit=50',
+     True, 200, 6),
+    ('subscribe', 'post', '/api/users/{author}/subscribe/', True, 200, 6),
+    ('unsubscribe', 'delete', '/api/users/{author}/subscribe/', True, 200, 8),
+    ('ingredients_list', 'get', '/api/ingredients/', False, 200, 2),
+    ('ingredients_search', 'get', '/api/ingredients/?name=са', False, 200, 1),
+    ('ingredients_detail', 'get', '/api/ingredients/{ingredient}/',
+     False, 200, 2),
+    ('tags_list', 'get', '/api/tags/', False, 200, 2),
+    ('tags_detail', 'get', '/api/tags/{tag_id}/', False, 200, 2),
+    ('users_list', 'get', '/api/users/', True, 200, 3),
+    ('users_list_limit_50', 'get', '/api/users/?limit=50', True, 200, 3),
+    ('users_list_fields', 'get', '/api/users/?fields=id,username',
+     True, 200, 3),
+    ('users_detail', 'get', '/api/users/{author}/', True, 200, 2),
+    ('users_me', 'get', '/api/users/me/', True, 200, 2),
+)
+
+
+def percentile(values, fraction):
+    """Процентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, int(round(fraction * len(ordered) + 0.5)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def tiny_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), '#c0ffee').save(buffer, format='PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+class Command(BaseCommand):
+    """Замер числа SQL-запросов и времени ответа всех эндпоинтов API."""
+    help = ('Заполняет временную БД и замеряет число запросов и время '
+            'ответа каждого эндпоинта API')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=300)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--output', help='Файл для сохранения результатов в JSON')
+        parser.add_argument(
+            '--compare', help='JSON с результатами предыдущего запуска')
+        parser.add_argument(
+            '--scenario', action='append',
+            help='Запустить только указанные сценарии')
+
+    def handle(self, *args, **options):
+        scenarios = [scenario for scenario in SCENARIOS
+                     if not options['scenario']
+                     or scenario[0] in options['scenario']]
+        media_root = tempfile.mkdtemp(prefix='foodgram-benchmark-')
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            # Фоновые задачи выполняются в самом запросе: иначе их запросы
+            # из служебного потока попадают в замеры других сценариев.
+            with override_settings(MEDIA_ROOT=media_root,
+                                   SHOPPING_LIST_WORKERS=0,
+                                   RECIPE_IMAGE_WORKERS=0):
+                context = self.seed(options)
+                results = [self.run_scenario(scenario, context, options)
+                           for scenario in scenarios]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+        self.report(results, options.get('compare'))
+        if options.get('output'):
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        failed = [result['name'] for result in results
+                  if result['status'] != [result['expected']]]
+        if failed:
+            raise CommandError(
+                'Неожиданный статус ответа: ' + ', '.join(failed))
+        failed = [result['name'] for result in results
+                  if result['queries'] > result['budget']]
+        if failed:
+            raise CommandError(
+                'Превышен предел SQL-запросов: ' + ', '.join(failed))
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        with open(os.path.join(settings.BASE_DIR, 'data', 'ingredients.json'),
+                  encoding='utf-8') as file:
+            catalog = json.load(file)[:options['ingredients']]
+        Ingredient.objects.bulk_create(
+            Ingredient(**ingredient) for ingredient in catalog)
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        tags = [Tag.objects.create(name=name, color=color, slug=slug)
+                for name, color, slug in (('Завтрак', '#E26C2D', 'breakfast'),
+                                          ('Обед', '#49B64E', 'dinner'),
+                                          ('Ужин', '#8775D2', 'supper'))]
+        users = [User.objects.create_user(
+            email=f'user{number}@benchmark.local',
+            username=f'user{number}',
+            first_name='Имя',
+            last_name='Фамилия',
+            password=PASSWORD,
+        ) for number in range(options['users'])]
+        Recipe.objects.bulk_create(Recipe(
+            author=rng.choice(users[:max(1, len(users) // 5)]),
+            name=f'Рецепт {number}',
+            image='recipes/image/benchmark.png',
+            text='Описание рецепта. ' * 20,
+            cooking_time=rng.randint(5, 120),
+        ) for number in range(options['recipes']))
+        recipes = list(Recipe.objects.values_list('id', flat=True))
+        TagRecipe.objects.bulk_create(
+            TagRecipe(recipe_id=recipe, tag=tag)
+            for recipe in recipes for tag in rng.sample(tags, 2))
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe_id=recipe, ingredient_id=ingredient,
+                             amount=rng.randint(1, 500))
+            for recipe in recipes
+            for ingredient in rng.sample(ingredients, 8))
+        search.rebuild()
+        user = users[0]
+        Favorite.objects.bulk_create(
+            Favorite(user=user, recipe_id=recipe)
+            for recipe in rng.sample(recipes, len(recipes) // 10))
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=user, recipe_id=recipe)
+            for recipe in rng.sample(recipes, 20))
+        Subscribe.objects.bulk_create(
+            Subscribe(user=user, following=author)
+            for author in users[1:len(users) // 2])
+        author = users[-1]
+        Subscribe.objects.filter(following=author).delete()
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        return {
+            'client': client,
+            'anonymous': APIClient(),
+            'user': user,
+            'author': author.id,
+            'recipe': rng.choice(
+                Recipe.objects.exclude(favorites__user=user).exclude(
+                    carts__user=user).values_list('id', flat=True)),
+            'ingredient': ingredients[0],
+            'ingredients': ingredients,
+            'tag': tags[0].slug,
+            'other_tag': tags[1].slug,
+            'tag_id': tags[0].id,
+            'image': tiny_image(),
+        }
+
+    def recipe_payload(self, context):
+        return {
+            'name': 'Рецепт из бенчмарка',
+            'text': 'Описание рецепта.',
+            'cooking_time': 30,
+            'image': context['image'],
+            'tags': [context['tag_id']],
+            'ingredients': [{'id': ingredient, 'amount': 10}
+                            for ingredient in context['ingredients'][:20]],
+        }
+
+    def prepare(self, name, context):
+        """Готовит состояние, которое нужно сценариям записи."""
+        user = context['user']
+        if name in ('recipes_update', 'recipes_update_text',
+                    'recipes_delete'):
+            recipe = Recipe.objects.create(
+                author=user, name='Свой рецепт', text='Описание',
+                image='recipes/image/benchmark.png', cooking_time=10)
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient_id=context['ingredient'])
+            context['own_recipe'] = recipe.id
+        elif name == 'favorite_remove':
+            Favorite.objects.get_or_create(
+                user=user, recipe_id=context['recipe'])
+        elif name == 'cart_remove':
+            ShoppingCart.objects.get_or_create(
+                user=user, recipe_id=context['recipe'])
+        elif name == 'unsubscribe':
+            Subscribe.objects.get_or_create(
+                user=user, following_id=context['author'])
+
+    def cleanup(self, name, context):
+        """Откатывает изменения сценариев записи перед следующим повтором."""
+        user = context['user']
+        if name == 'recipes_create':
+            Recipe.objects.filter(
+                author=user, name='Рецепт из бенчмарка').delete()
+        elif name in ('recipes_update', 'recipes_update_text'):
+            Recipe.objects.filter(id=context['own_recipe']).delete()
+        elif name == 'favorite_add':
+            Favorite.objects.filter(
+                user=user, recipe_id=context['recipe']).delete()
+        elif name == 'cart_add':
+            ShoppingCart.objects.filter(
+                user=user, recipe_id=context['recipe']).delete()
+        elif name == 'subscribe':
+            Subscribe.objects.filter(
+                user=user, following_id=context['author']).delete()
+
+    def run_scenario(self, scenario, context, options):
+        name, method, url, authenticated, expected, budget = scenario
+        client = context['client'] if authenticated else context['anonymous']
+        timings, queries, statuses = [], 0, set()
+        for _ in range(options['iterations']):
+            self.prepare(name, context)
+            data = None
+            if name in ('recipes_create', 'recipes_update'):
+                data = self.recipe_payload(context)
+            elif name == 'recipes_update_text':
+                data = {'text': 'Исправленное описание рецепта.'}
+            path = url.format(**context)
+            # Журнал запросов ограничен, без очистки он переполняется.
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, method)(path, data, format='json')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(captured.captured_queries))
+            statuses.add(response.status_code)
+            self.cleanup(name, context)
+        return {
+            'name': name,
+            'status': sorted(statuses),
+            'expected': expected,
+            'queries': queries,
+            'budget': budget,
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p90_ms': round(percentile(timings, 0.9), 3),
+            'p99_ms': round(percentile(timings, 0.99), 3),
+        }
+
+    def report(self, results, compare=None):
+        previous = {}
+        if compare:
+            with open(compare, encoding='utf-8') as file:
+                previous = {result['name']: result
+                            for result in json.load(file)}
+        self.stdout.write(
+            f'{"сценарий":<30}{"статус":>10}{"запросы":>10}'
+            f'{"p50, мс":>10}{"p90, мс":>10}{"p99, мс":>10}')
+        for result in results:
+            line = (
+                f'{result["name"]:<30}'
+                f'{",".join(map(str, result["status"])):>10}'
+                f'{result["queries"]:>6}/{result["budget"]:<3}'
+                f'{result["p50_ms"]:>10.2f}{result["p90_ms"]:>10.2f}'
+                f'{result["p99_ms"]:>10.2f}'
+            )
+            before = previous.get(result['name'])
+            if before:
+                line += (f'  (было {before["queries"]} запр., '
+                         f'p50 {before["p50_ms"]:.2f} мс)')
+            failed = (result['status'] != [result['expected']]
+                      or result['queries'] > result['budget'])
+            style = self.style.ERROR if failed else self.style.SUCCESS
+            self.stdout.write(style(line))
@@ -0,0 +1,95 @@
+import json
+import statistics
+import time
+
+from api.readers import RecipeReader
+from api.serializers import RecipeSerializer
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from recipes.models import Recipe
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from users.models import User
+
+PER_RECIPES = 100
+
+
+def median_ms(timings, recipes):
+    """Медиана в миллисекундах, приведённая к PER_RECIPES рецептам."""
+    return statistics.median(timings) * 1000 * PER_RECIPES / recipes
+
+
+class Command(BaseCommand):
+    """Замер сборки списка рецептов: RecipeSerializer и RecipeReader."""
+    help = ('Собирает страницу рецептов текущей базы через RecipeSerializer '
+            'и через RecipeReader, сверяет ответы и печатает время '
+            f'на {PER_RECIPES} рецептов: с запросами к БД и только сборку')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=PER_RECIPES)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument(
+            '--user', help='Email пользователя для флагов избранного и '
+                           'корзины; по умолчанию запрос анонимный')
+
+    def handle(self, *args, **options):
+        request = self.get_request(options['user'])
+        ids = list(Recipe.objects.values_list(
+            'id', flat=True)[:options['recipes']])
+        if not ids:
+            raise CommandError(
+                'Рецептов нет, заполните базу командой generate_fake_data')
+        with override_settings(ALLOWED_HOSTS=['*']):
+            results = [
+                self.measure('RecipeSerializer', self.drf, request, ids,
+                             options['iterations']),
+                self.measure('RecipeReader', self.reader, request, ids,
+                             options['iterations']),
+            ]
+        for name, total, build, _ in results:
+            self.stdout.write(
+                f'{name:<20} всего {median_ms(total, len(ids)):8.2f} мс, '
+                f'сборка {median_ms(build, len(ids)):8.2f} мс '
+                f'на {PER_RECIPES} рецептов')
+        if results[0][3] == results[1][3]:
+            self.stdout.write(self.style.SUCCESS('Ответы совпадают'))
+        else:
+            self.stdout.write(self.style.ERROR('Ответы различаются'))
+
+    def get_request(self, email):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = AnonymousUser()
+        if email:
+            request.user = User.objects.filter(email=email).first()
+            if request.user is None:
+                raise CommandError(f'Пользователь {email} не найден')
+        return request
+
+    def measure(self, name, method, request, ids, iterations):
+        """Время целиком и время сборки уже загруженных данных."""
+        total, build = [], []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            prepare, data = method(request, ids)
+            total.append(time.perf_counter() - started)
+            build.append(total[-1] - prepare)
+        return name, total, build, json.loads(JSONRenderer().render(data))
+
+    def drf(self, request, ids):
+        started = time.perf_counter()
+        recipes = list(Recipe.objects.with_user_flags(
+            request.user).with_related().filter(id__in=ids))
+        prepare = time.perf_counter() - started
+        return prepare, RecipeSerializer(
+            recipes, many=True, context={'request': request}).data
+
+    def reader(self, request, ids):
+        started = time.perf_counter()
+        reader = RecipeReader(request)
+        rows = list(reader.values(Recipe.objects.with_user_flags(
+            request.user).filter(id__in=ids)))
+        reader.load(rows)
+        prepare = time.perf_counter() - started
+        return prepare, reader.build(rows)
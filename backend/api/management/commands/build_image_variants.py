@@ -0,0 +1,27 @@
+from api import jobs
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Класс подготовки вариантов картинок рецептов."""
+    help = ('Готовит уменьшенные варианты картинок рецептов, для которых '
+            'их ещё нет. Картинка, общая для нескольких рецептов, '
+            'обрабатывается один раз')
+
+    def handle(self, *args, **options):
+        names = Recipe.objects.exclude(image='').exclude(
+            image_variants_for=F('image')).order_by().values_list(
+                'image', flat=True).distinct()
+        built = failed = 0
+        for name in list(names):
+            try:
+                jobs.build_variants_now(name)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+            else:
+                built += 1
+        self.stdout.write(
+            f'Готово картинок: {built}, с ошибками: {failed}')
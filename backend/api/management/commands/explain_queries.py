@@ -0,0 +1,140 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from recipes.models import Recipe, Tag
+from rest_framework.test import APIClient
+from users.models import User
+
+# Эндпоинты на чтение, запросы которых проверяются через EXPLAIN.
+ENDPOINTS = (
+    ('recipes_list', '/api/recipes/'),
+    ('recipes_list_cursor', '/api/recipes/?cursor='),
+    ('recipes_list_author', '/api/recipes/?author={author}'),
+    ('recipes_list_tags', '/api/recipes/?tags={tag}&tags={other_tag}'),
+    ('recipes_list_favorited', '/api/recipes/?is_favorited=1'),
+    ('recipes_list_in_cart', '/api/recipes/?is_in_shopping_cart=1'),
+    ('recipes_detail', '/api/recipes/{recipe}/'),
+    ('recipes_feed', '/api/recipes/feed/'),
+    ('download_shopping_cart', '/api/recipes/download_shopping_cart/'
+                               '?format=json'),
+    ('subscriptions', '/api/users/subscriptions/?recipes_limit=3'),
+    ('users_detail', '/api/users/{author}/'),
+    ('ingredients_search', '/api/ingredients/?name={ingredient}'),
+)
+
+SEQ_SCAN_PATTERNS = (
+    # PostgreSQL
+    re.compile(r'Seq Scan on (\w+)'),
+    # SQLite: SCAN без USING INDEX означает полный проход по таблице.
+    re.compile(r'^\s*SCAN (?:TABLE )?(\w+)(?!.*\bUSING\b.*\bINDEX\b)'),
+)
+
+
+def seq_scans(plan, tables):
+    """Таблицы, которые план читает целиком.
+
+    Подзапросы во FROM тоже читаются целиком, но это не таблицы БД.
+    """
+    scanned = []
+    for line in plan.splitlines():
+        for pattern in SEQ_SCAN_PATTERNS:
+            match = pattern.search(line)
+            if match and match.group(1) in tables:
+                scanned.append(match.group(1))
+    return scanned
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+        return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+
+class Command(BaseCommand):
+    """Проверка планов горячих запросов API на текущей БД."""
+    help = ('Выполняет запросы эндпоинтов API на чтение, прогоняет каждый '
+            'SQL через EXPLAIN и отмечает полные проходы по таблицам. '
+            'Планы имеют смысл на базе с рабочим объёмом данных')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', help='Email пользователя, от имени которого идут '
+                           'запросы; по умолчанию — с наибольшим числом '
+                           'подписок')
+        parser.add_argument(
+            '--ignore', action='append', default=[Tag._meta.db_table],
+            help='Небольшие таблицы, полный проход по которым допустим')
+        parser.add_argument('--verbose-plans', action='store_true')
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Завершиться с ошибкой, если найдены полные проходы')
+
+    def handle(self, *args, **options):
+        context = self.get_context(options)
+        client = APIClient()
+        client.force_authenticate(context['user'])
+        tables = set(connection.introspection.table_names()) - set(
+            options['ignore'])
+        flagged = []
+        with override_settings(ALLOWED_HOSTS=['*']):
+            for name, url in ENDPOINTS:
+                if self.check_endpoint(client, name, url.format(**context),
+                                       tables, options):
+                    flagged.append(name)
+        if flagged and options['strict']:
+            raise CommandError(
+                'Полные проходы по таблицам: ' + ', '.join(flagged))
+
+    def get_context(self, options):
+        users = User.objects.order_by('-subscriptions_count', 'id')
+        if options['user']:
+            users = users.filter(email=options['user'])
+        user = users.first()
+        author = User.objects.order_by('-recipes_count', 'id').first()
+        recipe = Recipe.objects.order_by('-pub_date', '-id').first()
+        tags = list(Tag.objects.annotate(
+            total=Count('tagrecipes')).order_by('-total').values_list(
+                'slug', flat=True)[:2])
+        if user is None or recipe is None or len(tags) < 2:
+            raise CommandError(
+                'Нужны пользователь, рецепт и два тега, заполните базу '
+                'командой generate_fake_data')
+        return {
+            'user': user,
+            'author': author.id,
+            'recipe': recipe.id,
+            'tag': tags[0],
+            'other_tag': tags[1],
+            'ingredient': (recipe.ingredients.values_list(
+                'name', flat=True).first() or 'а')[:3],
+        }
+
+    def check_endpoint(self, client, name, url, tables, options):
+        """Печатает итог по эндпоинту, True — если есть полные проходы."""
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        queries = [query['sql'] for query in captured.captured_queries
+                   if query['sql'].lstrip().upper().startswith(
+                       ('SELECT', 'WITH'))]
+        problems = []
+        for sql in dict.fromkeys(queries):
+            plan = explain(sql)
+            scanned = seq_scans(plan, tables)
+            if scanned:
+                problems.append((sql, plan, scanned))
+            elif options['verbose_plans']:
+                self.stdout.write(f'{sql}\n{plan}\n')
+        style = self.style.ERROR if problems else self.style.SUCCESS
+        self.stdout.write(style(
+            f'{name} [{response.status_code}]: запросов {len(queries)}, '
+            f'с полным проходом {len(problems)}'))
+        for sql, plan, scanned in problems:
+            self.stdout.write(f'  таблицы: {", ".join(scanned)}\n  {sql}')
+            if options['verbose_plans']:
+                self.stdout.write(f'{plan}\n')
+        return bool(problems)
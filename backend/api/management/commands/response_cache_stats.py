@@ -0,0 +1,26 @@
+from api import response_cache
+from api.views import IngredientViewSet, RecipeViewSet, TagViewSet
+from django.core.management.base import BaseCommand
+
+VIEWS = tuple(view.__name__ for view in (
+    RecipeViewSet, TagViewSet, IngredientViewSet))
+
+
+class Command(BaseCommand):
+    """Класс вывода статистики кэша ответов."""
+    help = ('Печатает число попаданий и промахов кэша ответов анонимным '
+            'посетителям по вьюсетам')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счётчики после вывода')
+
+    def handle(self, *args, **options):
+        for view, stats in response_cache.get_stats(VIEWS).items():
+            total = stats['hit'] + stats['miss']
+            ratio = stats['hit'] / total if total else 0
+            self.stdout.write(
+                f'{view:<20} попаданий {stats["hit"]:>8}, '
+                f'промахов {stats["miss"]:>8}, доля попаданий {ratio:.0%}')
+        if options['reset']:
+            response_cache.reset_stats(VIEWS)
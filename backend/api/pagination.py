@@ -1,6 +1,139 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Постраничный вывод по ключу без COUNT и OFFSET.
+
+    Записи идут по убыванию ключа keyset_fields, например (дата, id),
+    курсор хранит ключ последней записи страницы.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+    keyset_fields = ('pub_date', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fields = getattr(view, 'keyset_fields', self.keyset_fields)
+        queryset = queryset.order_by(*(f'-{field}' for field in self.fields))
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(
+                self.after(position),
+                **{f'{self.fields[0]}__lte': position[0]})
+        page_size = self.get_page_size(request)
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def after(self, position):
+        """Условие «ключ меньше курсора» в лексикографическом порядке."""
+        condition = Q()
+        for number, field in enumerate(self.fields):
+            condition |= Q(
+                **dict(zip(self.fields[:number], position)),
+                **{f'{field}__lt': position[number]})
+        return condition
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_key(self, item):
+        if isinstance(item, dict):
+            return [item[field] for field in self.fields]
+        return [getattr(item, field) for field in self.fields]
+
+    def encode_cursor(self, item):
+        key = [value.isoformat() if isinstance(value, datetime) else value
+               for value in self.get_key(item)]
+        return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(key, list) or len(key) != len(self.fields):
+                raise ValueError
+            position = [self.decode_value(field, value)
+                        for field, value in zip(self.fields, key)]
+        except (binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def decode_value(self, field, value):
+        """Значение по типу поля ключа: дата или целый id, иначе None."""
+        if field.endswith('date'):
+            return parse_datetime(value) if isinstance(value, str) else None
+        if field == 'id' or field.endswith('_id'):
+            return value if type(value) is int else None
+        return None
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
 
 
 class CustomPagination(PageNumberPagination):
+    """Постраничный вывод page/limit, с ?cursor= — курсорный режим.
+
+    Курсорный режим доступен вьюсетам с атрибутом keyset_fields. Если
+    вьюсет уже посчитал записи в total_count, COUNT(*) не повторяется.
+    """
     page_size = 6
     page_size_query_param = 'limit'
+    keyset = None
+    total_count = None
+
+    def django_paginator_class(self, queryset, page_size):
+        paginator = DjangoPaginator(queryset, page_size)
+        if self.total_count is not None:
+            paginator.count = self.total_count
+        return paginator
+
+    def use_keyset(self, request, view=None):
+        return (KeysetPagination.cursor_query_param in request.query_params
+                and hasattr(view, 'keyset_fields'))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request, view):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.total_count = getattr(view, 'total_count', None)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,193 @@
+from operator import itemgetter
+
+from api.serializers import (RecipeSerializer, SubscriptionSerializer,
+                             variant_path)
+from django.core.files.storage import default_storage
+from recipes.models import IngredientRecipe, Recipe, TagRecipe
+
+AUTHOR_COLUMNS = {
+    'id': 'author_id',
+    'username': 'author__username',
+    'email': 'author__email',
+    'first_name': 'author__first_name',
+    'last_name': 'author__last_name',
+}
+TAG_KEYS = ('id', 'name', 'color', 'slug')
+INGREDIENT_KEYS = ('id', 'name', 'measurement_unit', 'amount')
+PREVIEW_VARIANT = 'thumbnail'
+
+
+class RecipeReader:
+    """Список рецептов из строк .values() без полей DRF.
+
+    Ответ совпадает с RecipeSerializer, в том числе для ?fields= и
+    ?expand=. План полей строится один раз на запрос, а не для каждой
+    строки.
+    """
+    serializer_class = RecipeSerializer
+    column_fields = ('id', 'name', 'text', 'cooking_time')
+    image_variant = 'card'
+
+    def __init__(self, request, fields=None, expand=None):
+        if fields is None:
+            fields = self.serializer_class.Meta.fields
+            expand = tuple(self.serializer_class.collapsed_fields)
+        self.request = request
+        self.fields = fields
+        self.expand = expand
+        self.plan = [(name, self.get_reader(name))
+                     for name in self.serializer_class.Meta.fields
+                     if name in fields]
+        self.tags = self.ingredients = {}
+
+    def expanded(self, name):
+        return name in self.fields and name in self.expand
+
+    def get_reader(self, name):
+        if name in self.column_fields:
+            return itemgetter(name)
+        if name in self.serializer_class.collapsed_fields and (
+                name not in self.expand):
+            return getattr(self, f'read_{name}_keys')
+        return getattr(self, f'read_{name}')
+
+    def values(self, queryset):
+        """Только столбцы, нужные плану, и флаги пользователя."""
+        columns = ['id', 'author_id', 'pub_date', 'updated_at']
+        columns += [name for name in self.column_fields
+                    if name in self.fields and name != 'id']
+        if 'image' in self.fields:
+            columns += ['image', 'image_variants_for']
+        if self.expanded('author'):
+            columns += list(AUTHOR_COLUMNS.values())[1:]
+        return queryset.values(*columns, *queryset.query.annotations)
+
+    def read(self, rows):
+        rows = list(rows)
+        self.load(rows)
+        return self.build(rows)
+
+    def load(self, rows):
+        """Теги и продукты страницы, по запросу на каждую связь."""
+        ids = [row['id'] for row in rows]
+        if 'tags' in self.fields:
+            self.tags = self.load_tags(ids)
+        if 'ingredients' in self.fields:
+            self.ingredients = self.load_ingredients(ids)
+
+    def build(self, rows):
+        return [{name: read(row) for name, read in self.plan}
+                for row in rows]
+
+    def load_tags(self, ids):
+        tags = {recipe_id: [] for recipe_id in ids}
+        links = TagRecipe.objects.filter(recipe_id__in=ids).order_by('tag_id')
+        if not self.expanded('tags'):
+            for recipe_id, tag_id in links.values_list('recipe_id', 'tag_id'):
+                tags[recipe_id].append(tag_id)
+            return tags
+        for recipe_id, *tag in links.values_list(
+                'recipe_id', 'tag_id', 'tag__name', 'tag__color',
+                'tag__slug'):
+            tags[recipe_id].append(dict(zip(TAG_KEYS, tag)))
+        return tags
+
+    def load_ingredients(self, ids):
+        """Продукты в порядке, в котором их добавил автор."""
+        ingredients = {recipe_id: [] for recipe_id in ids}
+        links = IngredientRecipe.objects.filter(
+            recipe_id__in=ids).order_by('id')
+        if not self.expanded('ingredients'):
+            for recipe_id, ingredient_id, amount in links.values_list(
+                    'recipe_id', 'ingredient_id', 'amount'):
+                ingredients[recipe_id].append(
+                    {'id': ingredient_id, 'amount': amount})
+            return ingredients
+        for recipe_id, *ingredient in links.values_list(
+                'recipe_id', 'ingredient_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount'):
+            ingredients[recipe_id].append(
+                dict(zip(INGREDIENT_KEYS, ingredient)))
+        return ingredients
+
+    def read_author(self, row):
+        author = {key: row[column] for key, column in AUTHOR_COLUMNS.items()}
+        author['is_subscribed'] = row.get('author_subscribed', False)
+        return author
+
+    def read_author_keys(self, row):
+        return row['author_id']
+
+    def read_image(self, row):
+        if not row['image']:
+            return None
+        return self.request.build_absolute_uri(default_storage.url(
+            variant_path(row['image'], row['image_variants_for'],
+                         self.image_variant)))
+
+    def read_tags(self, row):
+        return self.tags[row['id']]
+
+    read_tags_keys = read_tags
+
+    def read_ingredients(self, row):
+        return self.ingredients[row['id']]
+
+    read_ingredients_keys = read_ingredients
+
+    def read_is_favorited(self, row):
+        return row.get('is_favorited', False)
+
+    def read_is_in_shopping_cart(self, row):
+        return row.get('is_in_shopping_cart', False)
+
+
+class SubscriptionReader:
+    """Список подписок из строк .values(), как SubscriptionSerializer."""
+    serializer_class = SubscriptionSerializer
+    column_fields = ('email', 'id', 'username', 'first_name', 'last_name',
+                     'recipes_count')
+
+    def __init__(self, recipes_limit=None, fields=None):
+        self.recipes_limit = recipes_limit
+        self.fields = fields or self.serializer_class.Meta.fields
+        self.plan = [(name, self.get_reader(name))
+                     for name in self.serializer_class.Meta.fields
+                     if name in self.fields]
+        self.previews = {}
+
+    def get_reader(self, name):
+        if name in self.column_fields:
+            return itemgetter(name)
+        return getattr(self, f'read_{name}')
+
+    def values(self, queryset):
+        return queryset.values(
+            *self.column_fields, *queryset.query.annotations)
+
+    def read(self, rows):
+        rows = list(rows)
+        if 'recipes' in self.fields:
+            self.previews = self.load_previews([row['id'] for row in rows])
+        return [{name: read(row) for name, read in self.plan}
+                for row in rows]
+
+    def load_previews(self, author_ids):
+        previews = {author_id: [] for author_id in author_ids}
+        for recipe in Recipe.objects.previews(author_ids, self.recipes_limit):
+            image = recipe.image.name
+            previews[recipe.author_id].append({
+                'id': recipe.id,
+                'name': recipe.name,
+                'cooking_time': recipe.cooking_time,
+                'image': default_storage.url(variant_path(
+                    image, recipe.image_variants_for,
+                    PREVIEW_VARIANT)) if image else None,
+            })
+        return previews
+
+    def read_is_subscribed(self, row):
+        return row.get('subscribed', True)
+
+    def read_recipes(self, row):
+        return self.previews[row['id']]
@@ -0,0 +1,95 @@
+import hashlib
+from functools import partial
+
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from recipes.versions import get_versions
+
+ALIAS = 'responses'
+STORED_HEADERS = ('Content-Type', 'ETag', 'Cache-Control', 'Vary')
+OUTCOMES = ('hit', 'miss')
+
+
+def get_cache():
+    return caches[ALIAS]
+
+
+def is_cacheable(request):
+    """Анонимный GET, ответ которого не зависит от пользователя.
+
+    Браузер с text/html в Accept получает Browsable API, а не JSON.
+    """
+    return (request.method == 'GET'
+            and 'HTTP_AUTHORIZATION' not in request.META
+            and 'text/html' not in request.META.get('HTTP_ACCEPT', '')
+            and request.GET.get('format', 'json') == 'json')
+
+
+def make_key(request, versions):
+    """Ключ не зависит от порядка параметров и повторяющихся значений."""
+    query = sorted((name, sorted(values))
+                   for name, values in request.GET.lists())
+    parts = (request.scheme, request.get_host(), request.path, query,
+             get_versions(versions))
+    return 'response:' + hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+# Счётчики лежат в основном кэше: он общий для всех процессов, и команда
+# response_cache_stats видит попадания воркеров.
+def count(view, outcome):
+    key = f'response-stats:{view}:{outcome}'
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Счётчик вытеснен из кэша между add и incr.
+        pass
+
+
+def get_stats(views):
+    keys = {f'response-stats:{view}:{outcome}': (view, outcome)
+            for view in views for outcome in OUTCOMES}
+    stats = {view: dict.fromkeys(OUTCOMES, 0) for view in views}
+    for key, value in cache.get_many(keys).items():
+        view, outcome = keys[key]
+        stats[view][outcome] = value
+    return stats
+
+
+def reset_stats(views):
+    cache.delete_many([f'response-stats:{view}:{outcome}'
+                       for view in views for outcome in OUTCOMES])
+
+
+def load(request, key):
+    """Сохранённый ответ или 304 по его ETag; None, если ответа нет."""
+    entry = get_cache().get(key)
+    if entry is None:
+        return None
+    content, headers = entry
+    response = get_conditional_response(request, etag=headers.get('ETag'))
+    if response is None:
+        response = HttpResponse(
+            content, content_type=headers.get('Content-Type'))
+    for name, value in headers.items():
+        if name != 'Content-Type':
+            response[name] = value
+    response['X-Cache'] = 'HIT'
+    return response
+
+
+def store(key, response):
+    headers = {name: response[name] for name in STORED_HEADERS
+               if response.has_header(name)}
+    get_cache().set(key, (response.content, headers))
+
+
+def store_on_render(key, response):
+    """Ответ DRF сохраняется после отрисовки, обычный — сразу."""
+    response['X-Cache'] = 'MISS'
+    if callable(getattr(response, 'add_post_render_callback', None)):
+        response.add_post_render_callback(partial(store, key))
+    else:
+        store(key, response)
+    return response
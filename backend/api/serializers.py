@@ -1,12 +1,48 @@
+import base64
+import binascii
+import copy
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
 from djoser.serializers import UserCreateSerializer
 from drf_extra_fields.fields import Base64ImageField
+from recipes import images
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Subscribe, Tag, TagRecipe)
+                            ShoppingCart, ShoppingListJob, Subscribe, Tag,
+                            TagRecipe)
 from rest_framework import serializers
 from users.models import User
 
 
-class UserSerializer(UserCreateSerializer):
+class SparseFieldsMixin:
+    """Поля ответа из ?fields=, связи не из ?expand= отдаются ключами.
+
+    Действует только на корневой сериализатор ответа.
+    """
+    collapsed_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, expand = self.context.get('fieldset', (None, None))
+        if requested is None or not self.is_response_root():
+            return fields
+        fields = {name: field for name, field in fields.items()
+                  if name in requested}
+        for name, field in self.collapsed_fields.items():
+            if name in fields and name not in expand:
+                fields[name] = copy.deepcopy(field)
+        return fields
+
+    def is_response_root(self):
+        return self.root is self or getattr(self.root, 'child', None) is self
+
+
+class UserSerializer(SparseFieldsMixin, UserCreateSerializer):
     """Создание сериализатора модели пользователя."""
     is_subscribed = serializers.SerializerMethodField()
 
@@ -21,12 +57,55 @@ class UserSerializer(UserCreateSerializer):
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
+        subscribed = getattr(obj, 'subscribed', None)
+        if subscribed is not None:
+            return subscribed
         return Subscribe.objects.filter(
             user=request.user,
             following__id=obj.id
         ).exists()
 
 
+def variant_path(name, variants_for, variant):
+    """Путь варианта картинки, пока вариантов нет — оригинала."""
+    if name == variants_for:
+        return images.variant_name(
+            name, variant, settings.RECIPE_IMAGE_FORMAT)
+    return name
+
+
+class ImageVariantField(serializers.ImageField):
+    """Адрес варианта картинки рецепта, пока его нет — оригинала.
+
+    Для просмотра одного рецепта можно указать отдельный вариант.
+    """
+
+    def __init__(self, variant, detail_variant=None, **kwargs):
+        self.variant = variant
+        self.detail_variant = detail_variant
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def get_variant(self):
+        view = self.context.get('view')
+        if self.detail_variant and getattr(view, 'action', '') == 'retrieve':
+            return self.detail_variant
+        return self.variant
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        name = variant_path(
+            recipe.image.name, recipe.image_variants_for, self.get_variant())
+        if not getattr(self, 'use_url', True):
+            return name
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
 class IngredientSerializer(serializers.ModelSerializer):
     """Создание сериализатора модели продуктов."""
     class Meta:
@@ -49,7 +128,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 
 class IngredientAmountRecipeSerializer(serializers.ModelSerializer):
     """Создание сериализатора ингредиентов с количеством продуктов."""
-    id = serializers.IntegerField(source='ingredient.id')
+    id = serializers.IntegerField(source='ingredient_id')
 
     class Meta:
         model = IngredientRecipe
@@ -68,7 +147,7 @@ class FavoriteSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     name = serializers.CharField()
     cooking_time = serializers.IntegerField()
-    image = Base64ImageField(max_length=None, use_url=False,)
+    image = ImageVariantField('thumbnail', use_url=False)
 
 
 class ShoppingCartSerializer(serializers.Serializer):
@@ -76,10 +155,39 @@ class ShoppingCartSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     name = serializers.CharField()
     cooking_time = serializers.IntegerField()
-    image = Base64ImageField(max_length=None, use_url=False,)
+    image = ImageVariantField('thumbnail', use_url=False)
+
+
+class RecipeUserFlagsMixin:
+    """Флаги избранного и корзины из аннотаций RecipeQuerySet."""
+
+    def get_user_flag(self, obj, name, model):
+        request = self.context.get('request')
+        if request.user.is_anonymous:
+            return False
+        flag = getattr(obj, name, None)
+        if flag is not None:
+            return flag
+        return model.objects.filter(
+            user=request.user,
+            recipe__id=obj.id
+        ).exists()
+
+    def get_is_favorited(self, obj):
+        return self.get_user_flag(obj, 'is_favorited', Favorite)
+
+    def get_is_in_shopping_cart(self, obj):
+        return self.get_user_flag(obj, 'is_in_shopping_cart', ShoppingCart)
+
+    def to_representation(self, instance):
+        author_subscribed = getattr(instance, 'author_subscribed', None)
+        if author_subscribed is not None:
+            instance.author.subscribed = author_subscribed
+        return super().to_representation(instance)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(SparseFieldsMixin, RecipeUserFlagsMixin,
+                       serializers.ModelSerializer):
     """Сериализатор для просмотра рецептов."""
     author = UserSerializer(read_only=True)
     tags = TagSerializer(many=True)
@@ -88,6 +196,14 @@ class RecipeSerializer(serializers.ModelSerializer):
         many=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image = ImageVariantField('card', detail_variant='full')
+
+    collapsed_fields = {
+        'author': serializers.PrimaryKeyRelatedField(read_only=True),
+        'tags': serializers.PrimaryKeyRelatedField(many=True, read_only=True),
+        'ingredients': IngredientAmountRecipeSerializer(
+            source='ingredientrecipes', many=True, read_only=True),
+    }
 
     class Meta:
         model = Recipe
@@ -95,34 +211,78 @@ class RecipeSerializer(serializers.ModelSerializer):
                   'ingredients', 'tags', 'cooking_time',
                   'is_in_shopping_cart', 'is_favorited')
 
-    def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(
-            user=request.user,
-            recipe__id=obj.id
-        ).exists()
 
-    def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
+class PrimaryKeyListField(serializers.ManyRelatedField):
+    """Список первичных ключей, проверяемый одним запросом.
+
+    Повторы отбрасываются, порядок сохраняется.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        queryset = self.child_relation.get_queryset()
+        keys = []
+        for key in data:
+            try:
+                keys.append(queryset.model._meta.pk.to_python(key))
+            except DjangoValidationError:
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(key).__name__)
+        keys = list(dict.fromkeys(keys))
+        objects = queryset.in_bulk(keys)
+        for key in keys:
+            if key not in objects:
+                self.child_relation.fail('does_not_exist', pk_value=key)
+        return [objects[key] for key in keys]
+
+
+class RecipeImageField(Base64ImageField):
+    """Картинка в base64, имя файла — хэш содержимого.
+
+    Если прислана текущая картинка рецепта (путь, адрес или те же байты),
+    она не декодируется и не сохраняется заново.
+    """
+
+    def get_file_name(self, decoded_file):
+        return hashlib.sha1(decoded_file).hexdigest()
+
+    def to_internal_value(self, data):
+        current = getattr(self.parent.instance, 'image', None)
+        if current and isinstance(data, str) and self.is_current(
+                current, data):
+            return current
+        return super().to_internal_value(data)
+
+    def is_current(self, current, data):
+        header, _, encoded = data.rpartition(';base64,')
+        if not header:
+            names = [current.name] + [
+                images.variant_name(
+                    current.name, variant, settings.RECIPE_IMAGE_FORMAT)
+                for variant in settings.RECIPE_IMAGE_VARIANTS]
+            return any(data == name or data.endswith(default_storage.url(
+                name)) for name in names)
+        try:
+            decoded = base64.b64decode(encoded)
+        except (binascii.Error, ValueError):
             return False
-        return ShoppingCart.objects.filter(
-            user=request.user,
-            recipe__id=obj.id
-        ).exists()
+        name = os.path.splitext(os.path.basename(current.name))[0]
+        return name == self.get_file_name(decoded)
 
 
-class RecipeSerializerPost(serializers.ModelSerializer):
+class RecipeSerializerPost(RecipeUserFlagsMixin,
+                           serializers.ModelSerializer):
     """Сериализатор для создания и изменения рецептов."""
     author = UserSerializer(read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True)
+    tags = PrimaryKeyListField(
+        child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=Tag.objects.all()))
     ingredients = IngredientAmountRecipeSerializer(
         source='ingredientrecipes', many=True)
-    image = Base64ImageField(max_length=None, use_url=False,)
+    image = RecipeImageField(max_length=None, use_url=False,)
     is_in_shopping_cart = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
 
@@ -132,89 +292,94 @@ class RecipeSerializerPost(serializers.ModelSerializer):
                   'ingredients', 'tags', 'cooking_time',
                   'is_in_shopping_cart', 'is_favorited')
 
-    def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(
-            user=request.user,
-            recipe__id=obj.id
-        ).exists()
-
-    def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(
-            user=request.user,
-            recipe__id=obj.id
-        ).exists()
-
-    def add_tags_and_ingredients(self, tags, ingredients, recipe):
-        for tag_data in tags:
-            recipe.tags.add(tag_data)
-            recipe.save()
-        for ingredient in ingredients:
-            if not IngredientRecipe.objects.filter(
-                    ingredient_id=ingredient['ingredient']['id'],
-                    recipe=recipe).exists():
-                ingredientrecipe = IngredientRecipe.objects.create(
-                    ingredient_id=ingredient['ingredient']['id'],
-                    recipe=recipe)
-                ingredientrecipe.amount = ingredient['amount']
-                ingredientrecipe.save()
-            else:
-                IngredientRecipe.objects.filter(
-                    recipe=recipe).delete()
-                recipe.delete()
-                raise serializers.ValidationError(
-                    'Данные продукты повторяются в рецепте!')
-        return recipe
-
+    def validate_ingredients(self, value):
+        ids = [item['ingredient_id'] for item in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Данные продукты повторяются в рецепте!')
+        missing = set(ids) - set(Ingredient.objects.filter(
+            id__in=ids).values_list('id', flat=True))
+        if missing:
+            raise serializers.ValidationError(
+                'Продукты не найдены: '
+                + ', '.join(map(str, sorted(missing))))
+        return value
+
+    def add_tags(self, recipe, tags):
+        TagRecipe.objects.bulk_create(
+            TagRecipe(recipe=recipe, tag=tag) for tag in tags)
+
+    def add_ingredients(self, recipe, ingredients):
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, **item) for item in ingredients)
+
+    @transaction.atomic
     def create(self, validated_data):
-        author = validated_data.get('author')
-        tags_data = validated_data.pop('tags')
-        name = validated_data.get('name')
-        image = validated_data.get('image')
-        text = validated_data.get('text')
-        cooking_time = validated_data.get('cooking_time')
+        tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredientrecipes')
-        recipe = Recipe.objects.create(
-            author=author,
-            name=name,
-            image=image,
-            text=text,
-            cooking_time=cooking_time,
-        )
-        return self.add_tags_and_ingredients(tags_data, ingredients, recipe)
+        recipe = Recipe.objects.create(**validated_data)
+        self.add_tags(recipe, tags)
+        self.add_ingredients(recipe, ingredients)
+        # Новый рецепт ещё не может быть в избранном или в корзине.
+        recipe.is_favorited = recipe.is_in_shopping_cart = False
+        return recipe
 
+    def update_tags(self, recipe, tags):
+        """Удаляет снятые теги и добавляет новые, не трогая остальные."""
+        current = set(recipe.tagrecipes.values_list('tag_id', flat=True))
+        removed = current - {tag.id for tag in tags}
+        if removed:
+            recipe.tagrecipes.filter(tag_id__in=removed).delete()
+        self.add_tags(recipe, [tag for tag in tags if tag.id not in current])
+
+    def update_ingredients(self, recipe, ingredients):
+        """Применяет к продуктам рецепта только изменения."""
+        current = {link.ingredient_id: link
+                   for link in recipe.ingredientrecipes.all()}
+        wanted = {item['ingredient_id']: item['amount']
+                  for item in ingredients}
+        removed = [link.id for ingredient_id, link in current.items()
+                   if ingredient_id not in wanted]
+        if removed:
+            IngredientRecipe.objects.filter(id__in=removed).delete()
+        changed = []
+        for ingredient_id, amount in wanted.items():
+            link = current.get(ingredient_id)
+            if link is not None and link.amount != amount:
+                link.amount = amount
+                changed.append(link)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        self.add_ingredients(recipe, [
+            item for item in ingredients
+            if item['ingredient_id'] not in current])
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredientrecipes')
-        TagRecipe.objects.filter(recipe=instance).delete()
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-        instance = self.add_tags_and_ingredients(
-            tags, ingredients, instance)
-        super().update(instance, validated_data)
-        instance.save()
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredientrecipes', None)
+        instance = super().update(instance, validated_data)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
         return instance
 
 
 class RecipeSimpleSerializer(serializers.ModelSerializer):
     """Сериализатор для упрощенного отображения рецептов в подписках."""
+    image = ImageVariantField('thumbnail')
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'cooking_time', 'image')
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для списка подписок."""
     recipes = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count',
-        read_only=True
-    )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -222,20 +387,31 @@ class SubscriptionSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        if request.GET.get('recipes_limit'):
-            recipes_limit = int(request.GET.get('recipes_limit'))
-            queryset = Recipe.objects.filter(author__id=obj.id).order_by('id')[
-                :recipes_limit]
-        else:
-            queryset = Recipe.objects.filter(author__id=obj.id).order_by('id')
-        return RecipeSimpleSerializer(queryset, many=True).data
+        recipes = Recipe.objects.previews(
+            [obj.id], self.context.get('recipes_limit'))
+        return RecipeSimpleSerializer(recipes, many=True).data
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
+        subscribed = getattr(obj, 'subscribed', None)
+        if subscribed is not None:
+            return subscribed
         return Subscribe.objects.filter(
             user=request.user,
             following__id=obj.id
         ).exists()
+
+
+class ShoppingListJobSerializer(serializers.ModelSerializer):
+    """Сериализатор задания на сборку списка покупок."""
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ShoppingListJob
+        fields = ('id', 'status', 'error', 'created', 'finished', 'url')
+
+    def get_url(self, obj):
+        return self.context['request'].build_absolute_uri(
+            reverse('api:download_job', args=(obj.id,)))
@@ -0,0 +1,102 @@
+import csv
+import io
+import json
+import threading
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+FONT_NAME = 'FreeSans'
+TITLE = 'Список покупок'
+MARGIN_X = 40
+TITLE_Y = 690
+FIRST_PAGE_Y = 650
+PAGE_Y = 700
+BOTTOM_Y = 100
+LEADING = 30
+
+_font_lock = threading.Lock()
+
+
+def register_font(font_path):
+    """Разбирает TTF один раз на процесс."""
+    if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return
+    with _font_lock:
+        if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+
+
+def format_item(number, item):
+    return (f'{number}.  {item["ingredient__name"]} - '
+            f'{item["ingredient_total"]}'
+            f' {item["ingredient__measurement_unit"]}')
+
+
+def paginate(lines):
+    """Делит строки на страницы: на первой место занимает заголовок."""
+    first_page = (FIRST_PAGE_Y - BOTTOM_Y) // LEADING + 1
+    per_page = (PAGE_Y - BOTTOM_Y) // LEADING + 1
+    yield FIRST_PAGE_Y, lines[:first_page]
+    for start in range(first_page, len(lines), per_page):
+        yield PAGE_Y, lines[start:start + per_page]
+
+
+def render_pdf(rows, font_path):
+    """Собирает PDF со списком покупок, по текстовому блоку на страницу."""
+    register_font(font_path)
+    buffer = io.BytesIO()
+    sheet = canvas.Canvas(buffer, pagesize=A4)
+    sheet.setTitle(TITLE)
+    sheet.setFont(FONT_NAME, 50)
+    sheet.drawString(MARGIN_X, TITLE_Y, f'{TITLE}: ')
+    lines = [format_item(number, item)
+             for number, item in enumerate(rows, start=1)]
+    for top, page in paginate(lines):
+        text = sheet.beginText(MARGIN_X, top)
+        text.setFont(FONT_NAME, 24, leading=LEADING)
+        text.textLines(page)
+        sheet.drawText(text)
+        sheet.showPage()
+    sheet.save()
+    return buffer.getvalue()
+
+
+def iter_txt(rows):
+    for number, item in enumerate(rows, start=1):
+        yield format_item(number, item) + '\n'
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('name', 'amount', 'measurement_unit'))
+    for item in rows:
+        writer.writerow((item['ingredient__name'], item['ingredient_total'],
+                         item['ingredient__measurement_unit']))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_json(rows):
+    separator = '['
+    for item in rows:
+        yield separator + json.dumps({
+            'name': item['ingredient__name'],
+            'amount': item['ingredient_total'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+# Лёгкие форматы отдаются потоком: формат -> (тип содержимого, генератор).
+STREAMING_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', iter_txt),
+    'csv': ('text/csv; charset=utf-8', iter_csv),
+    'json': ('application/json', iter_json),
+}
@@ -1,6 +1,6 @@
-from api.views import (CreateUserView, FavoriteViewSet, IngredientViewSet,
-                       RecipeViewSet, ShoppingCartViewSet, SubscribeViewSet,
-                       TagViewSet)
+from api.views import (CreateUserView, FavoriteViewSet, FeedViewSet,
+                       IngredientViewSet, RecipeViewSet, ShoppingCartViewSet,
+                       SubscribeViewSet, TagViewSet)
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
@@ -17,9 +17,14 @@ router.register(r'ingredients', IngredientViewSet, basename='ingredients')
 urlpatterns = [
     path('users/subscriptions/',
          SubscribeViewSet.as_view({'get': 'list'}), name='subscriptions'),
+    path('recipes/feed/',
+         FeedViewSet.as_view({'get': 'list'}), name='feed'),
     path('recipes/download_shopping_cart/',
          ShoppingCartViewSet.as_view({'get': 'download_shopping_cart'}),
          name='download'),
+    path('recipes/download_shopping_cart/<uuid:job_id>/',
+         ShoppingCartViewSet.as_view({'get': 'download_job'}),
+         name='download_job'),
     path('users/<users_id>/subscribe/',
          SubscribeViewSet.as_view({'post': 'create',
                                    'delete': 'delete'}), name='subscribe'),
@@ -1,85 +1,290 @@
 from http import HTTPStatus
 
-from api.filters import IngredientSearch, RecipeFilters
-from api.pagination import CustomPagination
+from api import (autocomplete, catalog, conditional, jobs, readers,
+                 response_cache, shopping_list)
+from api.filters import RecipeFilters
+from api.pagination import CustomPagination, KeysetPagination
 from api.serializers import (FavoriteSerializer, IngredientSerializer,
                              RecipeSerializer, RecipeSerializerPost,
-                             ShoppingCartSerializer, SubscriptionSerializer,
-                             TagSerializer, UserSerializer)
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.shortcuts import get_list_or_404, get_object_or_404
+                             ShoppingCartSerializer, ShoppingListJobSerializer,
+                             SubscriptionSerializer, TagSerializer,
+                             UserSerializer)
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (BooleanField, Count, Exists, F, Max, OuterRef,
+                              Sum, Value)
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Subscribe, Tag)
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
-from rest_framework import permissions, viewsets
+from recipes import feed, search
+from recipes.counters import add_favorite, remove_favorites
+from recipes.models import (Favorite, FeedEntry, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, ShoppingListJob, Subscribe,
+                            Tag)
+from recipes.versions import INGREDIENTS, RECIPES, TAGS, USERS, recipe_version
+from rest_framework import permissions, serializers, viewsets
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from users.models import User
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class FieldsetMixin:
+    """Набор полей ответа на GET из ?fields= и ?expand=."""
+
+    def get_fieldset(self):
+        """Поля и раскрытые связи ответа, (None, None) — полный ответ."""
+        params = self.request.query_params
+        if self.request.method != 'GET' or not (
+                'fields' in params or 'expand' in params):
+            return None, None
+        serializer_class = self.get_serializer_class()
+        fields = self.parse_names('fields', serializer_class.Meta.fields)
+        expand = self.parse_names(
+            'expand', serializer_class.collapsed_fields)
+        return fields or serializer_class.Meta.fields, expand or ()
+
+    def parse_names(self, param, allowed):
+        value = self.request.query_params.get(param)
+        if value is None:
+            return None
+        names = tuple(dict.fromkeys(
+            name.strip() for name in value.split(',') if name.strip()))
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            raise ValidationError({param: [
+                'Неизвестные поля: ' + ', '.join(unknown)]})
+        return names
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fieldset'] = self.get_fieldset()
+        return context
+
+
+class ResponseCacheMixin:
+    """Кэш ответов на анонимные GET, ключ включает версии данных.
+
+    Версии читаются до построения ответа: если запись успеет их сменить,
+    ответ ляжет под старым ключом и больше не будет выдан.
+    """
+    cache_versions = ()
+
+    def get_cache_versions(self, kwargs):
+        return self.cache_versions
+
+    def dispatch(self, request, *args, **kwargs):
+        versions = self.get_cache_versions(kwargs)
+        if versions is None or not response_cache.is_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+        key = response_cache.make_key(request, versions)
+        name = type(self).__name__
+        response = response_cache.load(request, key)
+        if response is not None:
+            response_cache.count(name, 'hit')
+            return response
+        response_cache.count(name, 'miss')
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == HTTPStatus.OK:
+            response_cache.store_on_render(key, response)
+        return response
+
+
+class TagViewSet(ResponseCacheMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для модели тегов."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    cache_versions = (TAGS,)
 
+    def list(self, request, *args, **kwargs):
+        return Response(list(self.get_queryset().values()))
 
-class IngredientViewSet(viewsets.ModelViewSet):
+
+class IngredientViewSet(ResponseCacheMixin, viewsets.ModelViewSet):
     """Вьюсет для модели продуктов."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny, )
-    filter_backends = (DjangoFilterBackend, IngredientSearch)
-    search_fields = ('name', )
+    cache_versions = (INGREDIENTS,)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(autocomplete.search(name))
+        snapshot = catalog.get_snapshot()
+        response = get_conditional_response(request, etag=snapshot.etag)
+        if response is None:
+            response = HttpResponse(
+                snapshot.body, content_type='application/json')
+        response['ETag'] = snapshot.etag
+        patch_cache_control(
+            response, public=True,
+            max_age=settings.INGREDIENT_CATALOG_MAX_AGE)
+        return response
 
 
-class CreateUserView(UserViewSet):
+class CreateUserView(FieldsetMixin, UserViewSet):
     """Вьюсет для модели юзера."""
     serializer_class = UserSerializer
+    pagination_class = CustomPagination
 
     def get_queryset(self):
-        return User.objects.all()
+        queryset = User.objects.all()
+        user = self.request.user
+        fields, _ = self.get_fieldset()
+        if user.is_anonymous or (
+                fields is not None and 'is_subscribed' not in fields):
+            return queryset
+        return queryset.annotate(subscribed=Exists(Subscribe.objects.filter(
+            user=user, following=OuterRef('pk'))))
+
+    def get_permissions(self):
+        if self.action == 'me':
+            return [permissions.IsAuthenticated()]
+        return super().get_permissions()
 
+    def list(self, request, *args, **kwargs):
+        # COUNT(*) считается без подзапроса подписки для каждой строки.
+        self.total_count = User.objects.count()
+        return super().list(request, *args, **kwargs)
 
-class SubscribeViewSet(viewsets.ModelViewSet):
+
+class SubscribeViewSet(FieldsetMixin, viewsets.ModelViewSet):
     """Вьюсет для модели подписок."""
     serializer_class = SubscriptionSerializer
     permission_classes = (permissions.IsAuthenticated, )
     pagination_class = CustomPagination
 
+    keyset_fields = ('subscription_id',)
+
     def get_queryset(self):
-        return get_list_or_404(User, following__user=self.request.user)
+        return User.objects.filter(
+            following__user=self.request.user
+        ).annotate(
+            subscribed=Value(True, output_field=BooleanField()),
+            subscription_id=F('following__id'),
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['recipes_limit'] = self.get_recipes_limit()
+        return context
+
+    def get_recipes_limit(self):
+        limit = self.request.query_params.get('recipes_limit')
+        if not limit:
+            return None
+        if not limit.isdigit():
+            raise ValidationError({'recipes_limit': [
+                'Укажите неотрицательное целое число']})
+        return int(limit)
+
+    def list(self, request, *args, **kwargs):
+        fields, _ = self.get_fieldset()
+        reader = readers.SubscriptionReader(self.get_recipes_limit(), fields)
+        page = self.paginate_queryset(reader.values(self.get_queryset()))
+        return self.get_paginated_response(reader.read(page))
 
     def create(self, request, *args, **kwargs):
         user_id = self.kwargs.get('users_id')
         user = get_object_or_404(User, id=user_id)
-        Subscribe.objects.create(
-            user=request.user, following=user)
+        feed.subscribe(Subscribe(user=request.user, following=user))
         return Response(HTTPStatus.CREATED)
 
     def delete(self, request, *args, **kwargs):
         author_id = self.kwargs['users_id']
         user_id = request.user.id
-        subscribe = get_object_or_404(
-            Subscribe, user__id=user_id, following__id=author_id)
-        subscribe.delete()
+        if not feed.unsubscribe(Subscribe.objects.filter(
+                user__id=user_id, following__id=author_id)):
+            raise Http404
         return Response(HTTPStatus.NO_CONTENT)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ResponseCacheMixin, FieldsetMixin,
+                    viewsets.ModelViewSet):
     """Вьюсет для модели рецептов."""
-    queryset = Recipe.objects.all()
     permission_classes = (permissions.IsAuthenticatedOrReadOnly, )
     pagination_class = CustomPagination
+    keyset_fields = ('pub_date', 'id')
     filter_class = RecipeFilters
     filter_backends = (DjangoFilterBackend, )
 
+    def get_cache_versions(self, kwargs):
+        """Список зависит от всех рецептов, рецепт — только от себя."""
+        pk = kwargs.get('pk')
+        if pk is None:
+            return RECIPES, USERS, TAGS, INGREDIENTS
+        if not pk.isdigit():
+            return None
+        return recipe_version(pk), USERS, TAGS, INGREDIENTS
+
+    def get_queryset(self):
+        fieldset = self.get_fieldset()
+        queryset = Recipe.objects.with_user_flags(self.request.user, *fieldset)
+        if self.request.method == 'GET':
+            return queryset.with_related(*fieldset)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # Флаги пользователя добавляются после фильтров, чтобы COUNT(*)
+        # и агрегаты не вычисляли подзапросы EXISTS для каждой строки.
+        queryset = self.filter_queryset(Recipe.objects.all())
+        fieldset = self.get_fieldset()
+        reader = readers.RecipeReader(request, *fieldset)
+        recipes = reader.values(
+            queryset.with_user_flags(request.user, *fieldset))
+        if self.paginator.use_keyset(request, self):
+            return self.list_keyset(request, recipes, reader)
+        state = queryset.aggregate(total=Count('id'), last=Max('updated_at'))
+        self.total_count = state['total']
+        etag = conditional.make_etag(
+            request.get_full_path(), state['total'], state['last'],
+            conditional.user_state(request.user))
+        response = conditional.conditional_response(request, etag)
+        if response is None:
+            page = self.paginate_queryset(self.rank(recipes))
+            response = self.get_paginated_response(reader.read(page))
+        return conditional.add_validators(request, response, etag)
+
+    def rank(self, queryset):
+        """С ?search= страницы упорядочены по весу совпадений."""
+        query = self.request.query_params.get('search')
+        if not query:
+            return queryset
+        return search.ranked(queryset, query)
+
+    def list_keyset(self, request, queryset, reader):
+        """Курсорный режим: без COUNT(*), ETag строится по самой странице."""
+        page = self.paginate_queryset(queryset)
+        etag = conditional.make_etag(
+            request.get_full_path(), self.paginator.keyset.has_next,
+            [(recipe['id'], recipe['updated_at']) for recipe in page],
+            conditional.user_state(request.user))
+        response = conditional.conditional_response(request, etag)
+        if response is None:
+            response = self.get_paginated_response(reader.read(page))
+        return conditional.add_validators(request, response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        state = conditional.recipe_state(request.user, kwargs['pk'])
+        if state is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = conditional.make_etag(request.get_full_path(), *state)
+        response = conditional.conditional_response(request, etag)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        return conditional.add_validators(request, response, etag)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        jobs.build_variants(serializer.instance)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        jobs.build_variants(serializer.instance)
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -87,6 +292,33 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return RecipeSerializerPost
 
 
+class FeedViewSet(FieldsetMixin, viewsets.GenericViewSet):
+    """Вьюсет ленты рецептов от авторов из подписок."""
+    serializer_class = RecipeSerializer
+    permission_classes = (permissions.IsAuthenticated, )
+    pagination_class = KeysetPagination
+    keyset_fields = ('pub_date', 'recipe_id')
+
+    def get_queryset(self):
+        user = self.request.user
+        if feed.is_materialized(user):
+            return FeedEntry.objects.filter(user=user).values(
+                'pub_date', 'recipe_id')
+        return Recipe.objects.filter(author__following__user=user).values(
+            'pub_date', recipe_id=F('id'))
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        fieldset = self.get_fieldset()
+        reader = readers.RecipeReader(request, *fieldset)
+        recipes = {recipe['id']: recipe for recipe in reader.values(
+            Recipe.objects.with_user_flags(request.user, *fieldset).filter(
+                id__in=[entry['recipe_id'] for entry in page]))}
+        return self.get_paginated_response(reader.read(
+            recipes[entry['recipe_id']] for entry in page
+            if entry['recipe_id'] in recipes))
+
+
 class ShoppingCartViewSet(viewsets.ModelViewSet):
     """Вьюсет модели корзины."""
     permission_classes = (permissions.IsAuthenticated, )
@@ -110,44 +342,95 @@ class ShoppingCartViewSet(viewsets.ModelViewSet):
         object.delete()
         return Response(HTTPStatus.NO_CONTENT)
 
-    @staticmethod
-    def canvas_method(dictionary):
-        response = HttpResponse(content_type='application/pdf')
+    def get_cart_rows(self):
+        return IngredientRecipe.objects.filter(
+            recipe__carts__user=self.request.user).values(
+            'ingredient__name', 'ingredient__measurement_unit').order_by(
+                'ingredient__name').annotate(ingredient_total=Sum('amount'))
+
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= выбирает формат списка покупок, а не рендерер DRF.
+        return super().perform_content_negotiation(request, force=True)
+
+    def download_shopping_cart(self, request):
+        file_format = request.query_params.get('format', 'pdf')
+        if file_format == 'pdf':
+            return self.download_pdf(request)
+        if file_format not in shopping_list.STREAMING_FORMATS:
+            raise ValidationError({'format': [
+                'Доступные форматы: pdf, '
+                + ', '.join(shopping_list.STREAMING_FORMATS)]})
+        content_type, stream = shopping_list.STREAMING_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            stream(self.get_cart_rows().iterator(
+                chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE)),
+            content_type=content_type)
         response['Content-Disposition'] = (
-            'attachment; filename = "shopping_cart.pdf"'
+            f'attachment; filename = "shopping_cart.{file_format}"'
         )
-        begin_position_x, begin_position_y = 40, 650
-        sheet = canvas.Canvas(response, pagesize=A4)
-        pdfmetrics.registerFont(TTFont('FreeSans',
-                                       'data/FreeSans.ttf'))
-        sheet.setFont('FreeSans', 50)
-        sheet.setTitle('Список покупок')
-        sheet.drawString(begin_position_x,
-                         begin_position_y + 40, 'Список покупок: ')
-        sheet.setFont('FreeSans', 24)
-        for number, item in enumerate(dictionary, start=1):
-            if begin_position_y < 100:
-                begin_position_y = 700
-                sheet.showPage()
-                sheet.setFont('FreeSans', 24)
-            sheet.drawString(
-                begin_position_x,
-                begin_position_y,
-                f'{number}.  {item["ingredient__name"]} - '
-                f'{item["ingredient_total"]}'
-                f' {item["ingredient__measurement_unit"]}'
+        return response
+
+    def download_pdf(self, request):
+        etag = conditional.make_etag(
+            'shopping_cart', *conditional.cart_state(request.user))
+        if self.is_async(request):
+            return self.enqueue_pdf(request, etag)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            key = f'shopping_cart:pdf:{request.user.id}'
+            cached = cache.get(key)
+            if cached is None or cached[0] != etag:
+                cached = (etag, shopping_list.render_pdf(
+                    self.get_cart_rows(), settings.SHOPPING_LIST_FONT))
+                cache.set(key, cached, settings.SHOPPING_LIST_CACHE_TIMEOUT)
+            response = HttpResponse(cached[1], content_type='application/pdf')
+            response['Content-Disposition'] = (
+                'attachment; filename = "shopping_cart.pdf"'
             )
-            begin_position_y -= 30
-        sheet.showPage()
-        sheet.save()
+        response['ETag'] = etag
+        patch_cache_control(response, private=True)
         return response
 
-    def download_shopping_cart(self, request):
-        result = IngredientRecipe.objects.filter(
-            recipe__carts__user=request.user).values(
-            'ingredient__name', 'ingredient__measurement_unit').order_by(
-                'ingredient__name').annotate(ingredient_total=Sum('amount'))
-        return self.canvas_method(result)
+    def is_async(self, request):
+        """Флаг ?async= разбирается как булево значение: async=0 — нет."""
+        value = request.query_params.get('async')
+        if not value:
+            return False
+        try:
+            return serializers.BooleanField().run_validation(value)
+        except ValidationError as error:
+            raise ValidationError({'async': error.detail})
+
+    def enqueue_pdf(self, request, etag):
+        job = ShoppingListJob.objects.filter(
+            user=request.user, version=etag).exclude(
+                status=ShoppingListJob.FAILED).first()
+        if job is None:
+            with transaction.atomic():
+                jobs.delete_finished(request.user)
+                job = ShoppingListJob.objects.create(
+                    user=request.user, version=etag)
+                job = jobs.start(job, self.get_cart_rows())
+        serializer = ShoppingListJobSerializer(
+            job, context=self.get_serializer_context())
+        if job.status == ShoppingListJob.DONE:
+            return Response(serializer.data)
+        return Response(serializer.data, status=HTTPStatus.ACCEPTED)
+
+    def download_job(self, request, job_id):
+        job = jobs.expire_stale(get_object_or_404(
+            ShoppingListJob, pk=job_id, user=request.user))
+        if job.status == ShoppingListJob.DONE:
+            response = FileResponse(
+                job.file.open('rb'), as_attachment=True,
+                filename='shopping_cart.pdf', content_type='application/pdf')
+            response['ETag'] = job.version
+            return response
+        serializer = ShoppingListJobSerializer(
+            job, context=self.get_serializer_context())
+        if job.status == ShoppingListJob.PENDING:
+            return Response(serializer.data, status=HTTPStatus.ACCEPTED)
+        return Response(serializer.data)
 
 
 class FavoriteViewSet(viewsets.ModelViewSet):
@@ -161,14 +444,13 @@ class FavoriteViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         recipe_id = int(self.kwargs['recipes_id'])
         recipe = get_object_or_404(Recipe, id=recipe_id)
-        self.model.objects.create(
-            user=request.user, recipe=recipe)
+        add_favorite(self.model(user=request.user, recipe=recipe))
         return Response(HTTPStatus.CREATED)
 
     def delete(self, request, *args, **kwargs):
         recipe_id = self.kwargs['recipes_id']
         user_id = request.user.id
-        object = get_object_or_404(
-            self.model, user__id=user_id, recipe__id=recipe_id)
-        object.delete()
+        if not remove_favorites(self.model.objects.filter(
+                user__id=user_id, recipe__id=recipe_id)):
+            raise Http404
         return Response(HTTPStatus.NO_CONTENT)
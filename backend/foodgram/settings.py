@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -10,7 +11,8 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = os.getenv('SECRET_KEY')
 
 
-DEBUG = True
+# В продакшене DEBUG=False: без журнала SQL-запросов и только JSON в API.
+DEBUG = os.getenv('DEBUG', default='True') == 'True'
 
 ALLOWED_HOSTS = ['localhost', '51.250.105.158']
 
@@ -77,6 +79,30 @@ DATABASES = {
 }
 
 
+# Основной кэш хранит версии данных, поэтому он общий для всех процессов:
+# воркеров и команд вроде load_ingredients. Кэш в памяти процесса запрещён.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram-cache')),
+    },
+    # Ответы анонимным посетителям: LocMemCache, FileBasedCache с каталогом
+    # в RESPONSE_CACHE_LOCATION или django_redis.cache.RedisCache.
+    'responses': {
+        'BACKEND': os.getenv(
+            'RESPONSE_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION', default='foodgram-responses'),
+        'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=300)),
+    },
+}
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -116,7 +142,7 @@ REST_FRAMEWORK = {
 
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',)
+    ) + (('rest_framework.renderers.BrowsableAPIRenderer',) if DEBUG else ())
 }
 
 DJOSER = {
@@ -138,3 +164,34 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+INGREDIENT_AUTOCOMPLETE_BACKEND = os.getenv(
+    'INGREDIENT_AUTOCOMPLETE_BACKEND', default='auto')
+INGREDIENT_AUTOCOMPLETE_LIMIT = 20
+INGREDIENT_CATALOG_MAX_AGE = 60
+
+SHOPPING_LIST_FONT = os.path.join(BASE_DIR, 'data', 'FreeSans.ttf')
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60
+SHOPPING_LIST_CHUNK_SIZE = 500
+SHOPPING_LIST_WORKERS = int(os.getenv('SHOPPING_LIST_WORKERS', default=2))
+SHOPPING_LIST_JOB_TIMEOUT = 5 * 60
+
+# Начиная с этого числа подписок лента хранится заранее в FeedEntry.
+FEED_FANOUT_THRESHOLD = 50
+
+# Конфигурация полнотекстового поиска Postgres; после смены нужно
+# пересобрать документы командой rebuild_search_index.
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', default='russian')
+
+# Варианты картинок рецептов: размер, в который вписывается картинка.
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (640, 640),
+    'full': (1280, 1280),
+}
+# JPEG или WEBP
+RECIPE_IMAGE_FORMAT = os.getenv('RECIPE_IMAGE_FORMAT', default='JPEG')
+RECIPE_IMAGE_QUALITY = 80
+# Свой пул процессов для вариантов, чтобы поток загрузок не задерживал
+# сборку списков покупок; 0 — варианты готовятся в самом запросе.
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=1))
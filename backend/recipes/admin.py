@@ -1,20 +1,24 @@
 from django.contrib import admin
 from users.models import User
 
+from . import feed
+from .counters import actual_count, add_favorite, remove_favorites
 from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                      ShoppingCart, Subscribe, Tag, TagRecipe)
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('username', 'email', 'id')
+    list_display = ('username', 'email', 'id', 'recipes_count')
     search_fields = ('username', 'email')
     empty_value_display = '-пусто-'
-    list_filter = ('username', 'email')
+    list_filter = ('is_staff', 'is_active')
+    show_full_result_count = False
 
 
 class IngredientRecipeInline(admin.TabularInline):
     model = IngredientRecipe
     extra = 0
+    autocomplete_fields = ('ingredient',)
 
 
 class TagRecipeInline(admin.TabularInline):
@@ -23,51 +27,103 @@ class TagRecipeInline(admin.TabularInline):
 
 
 class IngredientAdmin(admin.ModelAdmin):
-    list_display = ('name', 'measurement_unit')
+    list_display = ('name', 'measurement_unit', 'recipes_total')
     search_fields = ('name', )
     empty_value_display = '-пусто-'
-    list_filter = ('name',)
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Подзапрос считается только для строк текущей страницы.
+        return super().get_queryset(request).annotate(
+            recipes_total=actual_count(IngredientRecipe, 'ingredient'))
+
+    def recipes_total(self, obj):
+        return obj.recipes_total
+    recipes_total.short_description = 'Используется в рецептах'
 
 
 class TagAdmin(admin.ModelAdmin):
-    list_display = ('name', 'color', 'slug')
+    list_display = ('name', 'color', 'slug', 'recipes_total')
     search_fields = ('name', )
     empty_value_display = '-пусто-'
-    list_filter = ('name',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_total=actual_count(TagRecipe, 'tag'))
+
+    def recipes_total(self, obj):
+        return obj.recipes_total
+    recipes_total.short_description = 'Рецептов с тегом'
 
 
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe', 'id')
-    search_fields = ('user', )
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'user__email', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
     empty_value_display = '-пусто-'
-    list_filter = ('user',)
+    show_full_result_count = False
 
 
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
-    search_fields = ('user', )
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'user__email', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
     empty_value_display = '-пусто-'
-    list_filter = ('user',)
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        # При правке прежняя строка снимается со счётчика своего рецепта.
+        if change:
+            remove_favorites(Favorite.objects.filter(pk=obj.pk))
+        add_favorite(obj)
+
+    def delete_model(self, request, obj):
+        remove_favorites(Favorite.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        remove_favorites(queryset)
 
 
 class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientRecipeInline, TagRecipeInline,)
     list_display = ('name', 'author', 'cooking_time',
                     'id', 'add_favorite_count', 'pub_date')
-    search_fields = ('name', 'author', 'tags')
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username', 'author__email')
+    autocomplete_fields = ('author',)
     empty_value_display = '-пусто-'
-    list_filter = ('name', 'author', 'tags')
+    # Тегов немного, поэтому фильтр по ним не перебирает большую таблицу.
+    list_filter = ('tags',)
+    show_full_result_count = False
 
     def add_favorite_count(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
     add_favorite_count.short_description = 'Сколько раз добавлен в избранное'
+    add_favorite_count.admin_order_field = 'favorites_count'
 
 
 class SubscribeAdmin(admin.ModelAdmin):
     list_display = ('user', 'following')
-    search_fields = ('user', )
+    list_select_related = ('user', 'following')
+    search_fields = ('user__username', 'user__email',
+                     'following__username', 'following__email')
+    autocomplete_fields = ('user', 'following')
     empty_value_display = '-пусто-'
-    list_filter = ('user',)
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        # При правке прежняя подписка снимается со счётчика и ленты.
+        if change:
+            feed.unsubscribe(Subscribe.objects.filter(pk=obj.pk))
+        feed.subscribe(obj)
+
+    def delete_model(self, request, obj):
+        feed.unsubscribe(Subscribe.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        feed.unsubscribe(queryset)
 
 
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
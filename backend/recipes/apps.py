@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
 
 
 class RecipesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        # Версия, сменённая в одном процессе, должна дойти до остальных.
+        if settings.CACHES['default']['BACKEND'] in LOCAL_CACHES:
+            raise ImproperlyConfigured(
+                'Версии данных хранятся в основном кэше, он должен быть '
+                'общим для всех процессов: укажите в CACHE_BACKEND файловый '
+                'кэш, Memcached или Redis')
+        from . import signals  # noqa: F401
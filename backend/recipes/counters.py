@@ -0,0 +1,71 @@
+from collections import Counter
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from users.models import User
+
+from .models import Favorite, Recipe, Subscribe
+
+# Счётчик: модель со счётчиком, поле счётчика, связанная модель и её поле.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscriptions_count', Subscribe, 'user'),
+)
+
+
+def change(model, pk, field, delta):
+    """Атомарно меняет счётчик одним UPDATE без чтения строки."""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def add_favorite(favorite):
+    """Сохраняет избранное и увеличивает счётчик рецепта."""
+    favorite.save()
+    change(Recipe, favorite.recipe_id, 'favorites_count', 1)
+
+
+def remove_favorites(favorites):
+    """Удаляет избранное и уменьшает счётчики рецептов.
+
+    Счётчик меняется здесь, а не в post_delete: обработчик удаления
+    отключил бы быстрое каскадное удаление избранного с рецептом.
+    Возвращает число удалённых строк.
+    """
+    recipes = Counter(favorites.values_list('recipe_id', flat=True))
+    favorites.delete()
+    for recipe_id, total in recipes.items():
+        change(Recipe, recipe_id, 'favorites_count', -total)
+    return sum(recipes.values())
+
+
+def actual_count(related_model, related_field):
+    rows = related_model.objects.filter(
+        **{related_field: OuterRef('pk')}).order_by().values(
+            related_field).annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(rows), 0)
+
+
+def repair(model, field, related_model, related_field, batch_size=10000):
+    """Пересчитывает счётчик по диапазонам id, исправляя только расхождения.
+
+    Возвращает число исправленных строк.
+    """
+    actual = actual_count(related_model, related_field)
+    repaired = 0
+    last_pk = 0
+    while True:
+        ids = list(model.objects.filter(pk__gt=last_pk).order_by(
+            'pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return repaired
+        last_pk = ids[-1]
+        drifted = list(model.objects.filter(pk__in=ids).annotate(
+            actual=actual).exclude(**{field: F('actual')}).values_list(
+                'pk', flat=True))
+        if drifted:
+            model.objects.filter(pk__in=drifted).update(**{field: actual})
+            repaired += len(drifted)
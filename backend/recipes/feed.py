@@ -0,0 +1,89 @@
+import itertools
+
+from django.conf import settings
+from users.models import User
+
+from .counters import change
+from .models import FeedEntry, Recipe
+
+BATCH_SIZE = 1000
+
+
+def is_materialized(user):
+    """Ленту подписчика многих авторов читаем из FeedEntry."""
+    return user.subscriptions_count >= settings.FEED_FANOUT_THRESHOLD
+
+
+def insert(entries):
+    """Вставляет записи ленты пачками, повторы пропускаются."""
+    while True:
+        batch = list(itertools.islice(entries, BATCH_SIZE))
+        if not batch:
+            return
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fill(user_id, recipes):
+    rows = recipes.values_list('id', 'pub_date').iterator(
+        chunk_size=BATCH_SIZE)
+    insert(FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+           for recipe_id, pub_date in rows)
+
+
+def rebuild(user_id):
+    """Заново собирает сохранённую ленту пользователя."""
+    FeedEntry.objects.filter(user_id=user_id).delete()
+    fill(user_id, Recipe.objects.filter(author__following__user_id=user_id))
+
+
+def subscriptions_count(user_id):
+    return User.objects.filter(pk=user_id).values_list(
+        'subscriptions_count', flat=True).first() or 0
+
+
+def published(recipe):
+    """Раскладывает новый рецепт по сохранённым лентам подписчиков."""
+    followers = User.objects.filter(
+        follower__following_id=recipe.author_id,
+        subscriptions_count__gte=settings.FEED_FANOUT_THRESHOLD,
+    ).values_list('id', flat=True).iterator(chunk_size=BATCH_SIZE)
+    insert(FeedEntry(user_id=user_id, recipe_id=recipe.id,
+                     pub_date=recipe.pub_date) for user_id in followers)
+
+
+def followed(subscribe):
+    """Дополняет ленту после подписки, на пороге собирает её целиком."""
+    total = subscriptions_count(subscribe.user_id)
+    if total == settings.FEED_FANOUT_THRESHOLD:
+        rebuild(subscribe.user_id)
+    elif total > settings.FEED_FANOUT_THRESHOLD:
+        fill(subscribe.user_id,
+             Recipe.objects.filter(author_id=subscribe.following_id))
+
+
+def unfollowed(subscribe):
+    """Убирает рецепты автора, ниже порога лента больше не хранится."""
+    entries = FeedEntry.objects.filter(user_id=subscribe.user_id)
+    if subscriptions_count(subscribe.user_id) >= (
+            settings.FEED_FANOUT_THRESHOLD):
+        entries = entries.filter(recipe__author_id=subscribe.following_id)
+    entries.delete()
+
+
+# Счётчик и лента меняются здесь, а не в сигналах: обработчик удаления
+# отключил бы быстрое каскадное удаление подписок.
+def subscribe(subscription):
+    """Сохраняет подписку, увеличивает счётчик и дополняет ленту."""
+    subscription.save()
+    change(User, subscription.user_id, 'subscriptions_count', 1)
+    followed(subscription)
+
+
+def unsubscribe(subscriptions):
+    """Удаляет подписки со счётчиками и лентами; возвращает их число."""
+    subscriptions = list(subscriptions)
+    for subscription in subscriptions:
+        subscription.delete()
+        change(User, subscription.user_id, 'subscriptions_count', -1)
+        unfollowed(subscription)
+    return len(subscriptions)
@@ -0,0 +1,40 @@
+import io
+import os
+
+from PIL import Image
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+VARIANTS_DIR = 'recipes/variants'
+
+
+def variant_name(name, variant, image_format):
+    """Путь варианта картинки рядом с остальными вариантами."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return (f'{VARIANTS_DIR}/{stem}_{variant}.'
+            f'{EXTENSIONS[image_format]}')
+
+
+def render_variants(data, variants, image_format, quality):
+    """Уменьшенные и пережатые копии картинки: {вариант: байты}.
+
+    Не использует Django, поэтому выполняется в процессах пула.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        image = source.convert('RGBA') if source.mode in (
+            'P', 'LA') else source
+        if image.mode == 'RGBA':
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        rendered = {}
+        for variant, size in variants.items():
+            copy = image.copy()
+            copy.thumbnail(size, Image.LANCZOS)
+            buffer = io.BytesIO()
+            copy.save(buffer, format=image_format, quality=quality,
+                      optimize=True, progressive=True)
+            rendered[variant] = buffer.getvalue()
+    return rendered
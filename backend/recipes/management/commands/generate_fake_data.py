@@ -0,0 +1,229 @@
+import io
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Subscribe, Tag, TagRecipe)
+from recipes.versions import RECIPES, USERS, bump_version
+from users.models import User
+
+PLACEHOLDER_PATH = 'recipes/image/placeholder_{}.jpg'
+MAX_PAIR_ROUNDS = 5
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса, при которых первые элементы выбираются чаще."""
+    return list(itertools.accumulate(
+        1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+class Command(BaseCommand):
+    """Класс генерации тестовых данных для нагрузочного тестирования."""
+    help = ('Создаёт пользователей, рецепты, избранное, корзины и подписки '
+            'пакетными вставками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=6)
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=12)
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=10000)
+        parser.add_argument('--subscriptions', type=int, default=20000)
+        parser.add_argument('--images', type=int, default=8,
+                            help='Число картинок-заглушек на все рецепты')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель распределения Ципфа')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='fake')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if not Ingredient.objects.exists():
+            raise CommandError(
+                'Справочник продуктов пуст, сначала выполните '
+                'load_ingredients')
+        if options['images'] < 1:
+            raise CommandError('Нужна хотя бы одна картинка-заглушка')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        tags = self.step('Теги', self.create_tags, options)
+        images = self.step('Картинки', self.create_images, options)
+        users = self.step('Пользователи', self.create_users, options)
+        recipes = self.step(
+            'Рецепты', self.create_recipes, options, users, images)
+        self.step('Теги рецептов', self.create_tag_links, recipes, tags)
+        self.step('Продукты рецептов', self.create_ingredient_links,
+                  options, recipes)
+        users_cum = zipf_weights(len(users), options['skew'])
+        recipes_cum = zipf_weights(len(recipes), options['skew'])
+        for title, model, field, total in (
+                ('Избранное', Favorite, 'recipe_id', options['favorites']),
+                ('Корзины', ShoppingCart, 'recipe_id', options['carts'])):
+            self.step(title, self.create_pairs, model, total,
+                      (users, users_cum), (recipes, recipes_cum), field)
+        self.step('Подписки', self.create_pairs, Subscribe,
+                  options['subscriptions'], (users, users_cum),
+                  (users, users_cum), 'following_id')
+        # Пакетные вставки минуют сигналы, поэтому счётчики и ленты
+        # пересчитываются отдельно.
+        self.step('Счётчики', call_command, 'recount_counters',
+                  f'--batch-size={self.batch_size}')
+        self.step('Ленты', call_command, 'rebuild_feeds')
+        self.step('Поиск', call_command, 'rebuild_search_index')
+        self.step('Варианты картинок', call_command, 'build_image_variants')
+        for name in (RECIPES, USERS):
+            bump_version(name)
+
+    def step(self, title, method, *args):
+        started = time.monotonic()
+        try:
+            return method(*args)
+        finally:
+            self.stdout.write(
+                f'{title}: {time.monotonic() - started:.1f} с')
+
+    def bulk_insert(self, model, objects, ignore_conflicts=False):
+        """Вставляет объекты пачками, каждая пачка в своей транзакции."""
+        created = 0
+        for chunk in chunked(objects, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    chunk, ignore_conflicts=ignore_conflicts)
+            created += len(chunk)
+        return created
+
+    def create_tags(self, options):
+        for number in range(options['tags']):
+            Tag.objects.get_or_create(
+                slug=f'{options["prefix"]}-tag-{number}',
+                defaults={'name': f'Тег {options["prefix"]} {number}',
+                          'color': f'#{self.rng.randrange(16 ** 6):06X}'})
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_images(self, options):
+        """Небольшой общий набор картинок вместо файла на каждый рецепт."""
+        names = []
+        for number in range(options['images']):
+            name = PLACEHOLDER_PATH.format(number)
+            # Цвет выбирается и для готового файла, иначе повторный запуск
+            # с тем же --seed получит другую последовательность чисел.
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            if not default_storage.exists(name):
+                buffer = io.BytesIO()
+                Image.new('RGB', (480, 320), color).save(
+                    buffer, format='JPEG', quality=70)
+                name = default_storage.save(
+                    name, ContentFile(buffer.getvalue()))
+            names.append(name)
+        return names
+
+    def create_users(self, options):
+        prefix = options['prefix']
+        start = User.objects.filter(username__startswith=prefix).count()
+        password = make_password(prefix)
+        self.bulk_insert(User, (User(
+            username=f'{prefix}{number}',
+            email=f'{prefix}{number}@example.com',
+            first_name='Имя',
+            last_name='Фамилия',
+            password=password,
+        ) for number in range(start, start + options['users'])))
+        return list(User.objects.filter(
+            username__startswith=prefix).order_by('id').values_list(
+                'id', flat=True))
+
+    def create_recipes(self, options, users, images):
+        last_id = Recipe.objects.aggregate(last=Max('id'))['last'] or 0
+        authors = self.rng.choices(
+            users, cum_weights=zipf_weights(len(users), options['skew']),
+            k=options['recipes'])
+        self.bulk_insert(Recipe, (Recipe(
+            author_id=author,
+            name=f'Рецепт {number}',
+            image=images[number % len(images)],
+            text=' '.join(self.rng.choices(
+                ('Нарежьте', 'смешайте', 'обжарьте', 'добавьте', 'соль',
+                 'перец', 'запекайте', 'подавайте', 'горячим', 'масло'),
+                k=40)),
+            cooking_time=self.rng.randint(5, 180),
+        ) for number, author in enumerate(authors)))
+        recipes = list(Recipe.objects.filter(id__gt=last_id).order_by(
+            'id').values_list('id', flat=True))
+        # auto_now_add перезаписывает дату при вставке, поэтому даты
+        # публикации разносятся по времени отдельными обновлениями пачек.
+        now = timezone.now()
+        for number, chunk in enumerate(chunked(
+                reversed(recipes), self.batch_size)):
+            Recipe.objects.filter(id__in=chunk).update(
+                pub_date=now - timedelta(hours=number))
+        return recipes
+
+    def create_tag_links(self, recipes, tags):
+        return self.bulk_insert(TagRecipe, (
+            TagRecipe(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in self.rng.sample(
+                tags, self.rng.randint(1, min(3, len(tags))))))
+
+    def create_ingredient_links(self, options, recipes):
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        return self.bulk_insert(IngredientRecipe, (
+            IngredientRecipe(recipe_id=recipe, ingredient_id=ingredient,
+                             amount=self.rng.randint(1, 1000))
+            for recipe in recipes
+            for ingredient in self.rng.sample(ingredients, self.rng.randint(
+                options['min_ingredients'],
+                min(options['max_ingredients'], len(ingredients))))))
+
+    def create_pairs(self, model, total, users, targets, field):
+        """Создаёт связи: активные пользователи и популярные цели чаще.
+
+        Повторяющиеся пары отбрасываются базой, поэтому недостающие связи
+        догенерируются несколькими раундами.
+        """
+        population, cum_weights = users
+        target_population, target_weights = targets
+
+        def pairs(count):
+            for chunk in chunked(range(count), self.batch_size):
+                followers = self.rng.choices(
+                    population, cum_weights=cum_weights, k=len(chunk))
+                chosen = self.rng.choices(
+                    target_population, cum_weights=target_weights,
+                    k=len(chunk))
+                for user, target in zip(followers, chosen):
+                    if field == 'following_id' and user == target:
+                        continue
+                    yield model(user_id=user, **{field: target})
+
+        initial = model.objects.count()
+        created = 0
+        for _ in range(MAX_PAIR_ROUNDS):
+            if created >= total:
+                break
+            self.bulk_insert(
+                model, pairs(total - created), ignore_conflicts=True)
+            created = model.objects.count() - initial
+        return created
@@ -1,22 +1,117 @@
+import csv
+import itertools
 import json
+import os
+import time
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from recipes.models import Ingredient
+from recipes.versions import INGREDIENTS, bump_version
+
+DEFAULT_PATH = os.path.join('data', 'ingredients.json')
+READ_SIZE = 64 * 1024
+FIELDS = ('name', 'measurement_unit')
+MALFORMED = '{}: нужны название продукта и единица измерения'
+
+
+def iter_json_array(file):
+    """Построчно отдаёт объекты из JSON-массива, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: file.read(READ_SIZE), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and buffer[position:position + 1] == '[':
+                started = True
+                position += 1
+                continue
+            if buffer[position:position + 1] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            yield item
+        buffer = buffer[position:]
+    if buffer.strip():
+        raise CommandError('Файл JSON обрезан или повреждён')
+
+
+def is_valid(item):
+    """Объект с непустыми строками name и measurement_unit."""
+    return isinstance(item, dict) and all(
+        isinstance(item.get(field), str) and item[field].strip()
+        for field in FIELDS)
+
+
+def iter_json_items(file):
+    for number, item in enumerate(iter_json_array(file)):
+        if not is_valid(item):
+            raise CommandError(MALFORMED.format(f'Элемент {number}'))
+        yield item
+
+
+def iter_csv_rows(file):
+    """Читает CSV с заголовком name,measurement_unit или без него."""
+    reader = csv.reader(file)
+    for row in reader:
+        if not row:
+            continue
+        if [column.strip() for column in row[:2]] == [
+                'name', 'measurement_unit']:
+            continue
+        item = dict(zip(FIELDS, row))
+        if not is_valid(item):
+            raise CommandError(MALFORMED.format(f'Строка {reader.line_num}'))
+        yield item
 
 
 class Command(BaseCommand):
     """Класс загрузки ингредиентов в БД"""
+    help = ('Загружает справочник продуктов из JSON или CSV. Повторная '
+            'загрузка не создаёт дублей')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument('--format', choices=('json', 'csv'))
+        parser.add_argument('--batch-size', type=int, default=1000)
+
     def handle(self, *args, **options):
-        ingredients_file = open(
-            'data/ingredients.json',
-            encoding='utf-8'
-        )
-        ingredients_str = ingredients_file.read()
-        ingredients_data = json.loads(ingredients_str)
-        for ingredient in ingredients_data:
-            name = ingredient['name']
-            measurement_unit = ingredient['measurement_unit']
-            Ingredient.objects.create(
-                name=name,
-                measurement_unit=measurement_unit
-            )
+        path = options['path']
+        if not os.path.isabs(path) and not os.path.exists(path):
+            path = os.path.join(settings.BASE_DIR, path)
+        file_format = options['format'] or (
+            'csv' if path.lower().endswith('.csv') else 'json')
+        reader = iter_csv_rows if file_format == 'csv' else iter_json_items
+        started = time.monotonic()
+        before = Ingredient.objects.count()
+        with open(path, encoding='utf-8', newline='') as file:
+            processed = self.load(reader(file), options['batch_size'])
+        created = Ingredient.objects.count() - before
+        if created:
+            bump_version(INGREDIENTS)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {processed}, добавлено новых: {created}, '
+            f'{processed / elapsed:.0f} строк/с'))
+
+    def load(self, rows, batch_size):
+        """Вставляет пачками, существующие пары (name, unit) пропускаются."""
+        processed = 0
+        ingredients = (
+            Ingredient(name=row['name'].strip(),
+                       measurement_unit=row['measurement_unit'].strip())
+            for row in rows)
+        with transaction.atomic():
+            while True:
+                batch = list(itertools.islice(ingredients, batch_size))
+                if not batch:
+                    return processed
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                processed += len(batch)
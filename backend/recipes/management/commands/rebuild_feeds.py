@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes import feed
+from recipes.models import FeedEntry
+from users.models import User
+
+
+class Command(BaseCommand):
+    """Класс пересборки сохранённых лент подписчиков."""
+    help = ('Собирает ленты пользователей с числом подписок не меньше '
+            'FEED_FANOUT_THRESHOLD и удаляет ленты остальных')
+
+    def handle(self, *args, **options):
+        FeedEntry.objects.exclude(
+            user__subscriptions_count__gte=settings.FEED_FANOUT_THRESHOLD
+        ).delete()
+        followers = list(User.objects.filter(
+            subscriptions_count__gte=settings.FEED_FANOUT_THRESHOLD
+        ).values_list('id', flat=True))
+        for user_id in followers:
+            feed.rebuild(user_id)
+        self.stdout.write(f'Собрано лент: {len(followers)}')
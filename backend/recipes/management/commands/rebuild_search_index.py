@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes import search
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Класс пересборки документов полнотекстового поиска."""
+    help = ('Заново собирает документы поиска рецептов: после пакетных '
+            'вставок или смены RECIPE_SEARCH_CONFIG')
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError(
+                'Полнотекстовый поиск есть только на PostgreSQL и SQLite')
+        search.rebuild()
+        self.stdout.write(f'Документов поиска: {Recipe.objects.count()}')
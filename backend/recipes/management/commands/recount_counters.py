@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from recipes.counters import COUNTERS, repair
+
+
+class Command(BaseCommand):
+    """Класс пересчёта денормализованных счётчиков."""
+    help = ('Пересчитывает favorites_count рецептов, recipes_count и '
+            'subscriptions_count пользователей и исправляет расхождения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        for model, field, related_model, related_field in COUNTERS:
+            repaired = repair(model, field, related_model, related_field,
+                              options['batch_size'])
+            self.stdout.write(
+                f'{model._meta.label}.{field}: исправлено {repaired}')
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.19 on 2026-10-18 16:46
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_favorites(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    favorites = Favorite.objects.filter(recipe=OuterRef('pk')).order_by(
+        ).values('recipe').annotate(total=Count('id')).values('total')
+    Recipe.objects.update(favorites_count=Coalesce(Subquery(favorites), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_shoppinglistjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Сколько раз добавлен в избранное'),
+        ),
+        migrations.RunPython(count_favorites, migrations.RunPython.noop),
+    ]
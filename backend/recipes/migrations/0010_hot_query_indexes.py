@@ -0,0 +1,53 @@
+# Generated by Django 2.2.19 on 2026-10-18 16:55
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_links(apps, schema_editor):
+    """Оставляет одну связь рецепта с каждым продуктом и тегом."""
+    for model_name, field in (('IngredientRecipe', 'ingredient'),
+                              ('TagRecipe', 'tag')):
+        model = apps.get_model('recipes', model_name)
+        duplicates = model.objects.values('recipe', field).annotate(
+            keep_id=Min('id'), total=Count('id')).filter(total__gt=1)
+        for duplicate in duplicates:
+            model.objects.filter(
+                recipe=duplicate['recipe'], **{field: duplicate[field]}
+            ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_pub_date_id_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-id'], name='favorite_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['user', '-id'], name='shoppingcart_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscribe',
+            index=models.Index(fields=['user', '-id'], name='subscribe_user_id_idx'),
+        ),
+        migrations.RunPython(
+            remove_duplicate_links, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredientrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_ingredient_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='tagrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'tag'), name='unique_tag_recipe'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants_for',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Картинка, для которой готовы варианты'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.db import migrations
+
+CREATE = {
+    'postgresql': (
+        'CREATE TABLE recipes_recipe_search ('
+        'recipe_id integer PRIMARY KEY REFERENCES recipes_recipe (id) '
+        'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+        'document tsvector NOT NULL)',
+        'CREATE INDEX recipes_recipe_search_document '
+        'ON recipes_recipe_search USING gin (document)',
+    ),
+    'sqlite': (
+        'CREATE VIRTUAL TABLE recipes_recipe_search USING fts5('
+        "name, ingredients, text, tokenize = 'unicode61 remove_diacritics 2')",
+    ),
+}
+SOURCE = (
+    'FROM recipes_recipe recipe '
+    'LEFT JOIN recipes_ingredientrecipe link ON link.recipe_id = recipe.id '
+    'LEFT JOIN recipes_ingredient ingredient '
+    'ON ingredient.id = link.ingredient_id '
+    'GROUP BY recipe.id')
+FILL = {
+    'postgresql': (
+        'INSERT INTO recipes_recipe_search (recipe_id, document) '
+        'SELECT recipe.id, '
+        "setweight(to_tsvector(%s, recipe.name), 'A') || "
+        'setweight(to_tsvector(%s, '
+        "COALESCE(string_agg(ingredient.name, ' '), '')), 'B') || "
+        "setweight(to_tsvector(%s, recipe.text), 'C') " + SOURCE),
+    'sqlite': (
+        'INSERT INTO recipes_recipe_search (rowid, name, ingredients, text) '
+        'SELECT recipe.id, recipe.name, '
+        "COALESCE(group_concat(ingredient.name, ' '), ''), recipe.text "
+        + SOURCE),
+}
+
+
+def create_search(apps, schema_editor):
+    """Документы поиска по названию, продуктам и описанию рецептов."""
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE:
+        return
+    for statement in CREATE[vendor]:
+        schema_editor.execute(statement)
+    params = ()
+    if vendor == 'postgresql':
+        params = (settings.RECIPE_SEARCH_CONFIG,) * 3
+    schema_editor.execute(FILL[vendor], params)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE:
+        schema_editor.execute('DROP TABLE recipes_recipe_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_tagrecipe_tag_recipe_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
@@ -1,6 +1,10 @@
+import uuid
+
 from colorfield.fields import ColorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Prefetch, Window
+from django.db.models.functions import RowNumber
 from users.models import User
 
 
@@ -49,11 +53,81 @@ class Ingredient(models.Model):
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='unique_ingredient')
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов для рецептов."""
+
+    def with_related(self, fields=None, expand=None):
+        """Подгружает автора, теги и продукты фиксированным числом запросов.
+
+        Если заданы поля ответа, подгружаются только нужные из них, а связи
+        не из expand — без вложенных объектов.
+        """
+        if fields is None:
+            fields = expand = ('author', 'tags', 'ingredients', 'text')
+        queryset = self if 'text' in fields else self.defer('text')
+        if 'author' in fields and 'author' in expand:
+            queryset = queryset.select_related('author')
+        if 'tags' in fields:
+            queryset = queryset.prefetch_related('tags')
+        if 'ingredients' not in fields:
+            return queryset
+        links = IngredientRecipe.objects.all()
+        if 'ingredients' in expand:
+            links = links.select_related('ingredient')
+        return queryset.prefetch_related(
+            Prefetch('ingredientrecipes', queryset=links))
+
+    def with_user_flags(self, user, fields=None, expand=None):
+        """Добавляет флаги избранного, корзины и подписки на автора.
+
+        Если заданы поля ответа, добавляются только флаги для них.
+        """
+        if user.is_anonymous:
+            return self
+        flags = {
+            'is_favorited': Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            'is_in_shopping_cart': Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            'author_subscribed': Exists(Subscribe.objects.filter(
+                user=user, following=OuterRef('author'))),
+        }
+        if fields is not None:
+            wanted = set(fields)
+            if 'author' in fields and 'author' in expand:
+                wanted.add('author_subscribed')
+            flags = {name: flag for name, flag in flags.items()
+                     if name in wanted}
+        return self.annotate(**flags)
+
+    def previews(self, author_ids, limit=None):
+        """Первые рецепты каждого из авторов одним запросом."""
+        queryset = self.filter(author_id__in=author_ids).only(
+            'id', 'author_id', 'name', 'image', 'image_variants_for',
+            'cooking_time'
+        ).order_by('author_id', 'id')
+        if limit is None:
+            return queryset
+        # Django не умеет фильтровать по оконной функции, поэтому
+        # ROW_NUMBER оборачивается во внешний запрос.
+        sql, params = queryset.annotate(preview_rank=Window(
+            RowNumber(), partition_by=[F('author_id')],
+            order_by=F('id').asc(),
+        )).query.sql_with_params()
+        return self.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE preview_rank <= %s '
+            f'ORDER BY author_id, id', (*params, limit))
+
+
 class Recipe(models.Model):
     """Модель рецепта."""
     author = models.ForeignKey(
@@ -99,11 +173,38 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата создания'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        db_index=True,
+        editable=False,
+        verbose_name='Сколько раз добавлен в избранное'
+    )
+    image_variants_for = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        verbose_name='Картинка, для которой готовы варианты'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ('-pub_date', )
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_idx'),
+            # COUNT и MAX(updated_at) для ETag списка читаются из индекса.
+            models.Index(fields=['updated_at', 'id'],
+                         name='recipe_updated_at_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -135,6 +236,10 @@ class IngredientRecipe(models.Model):
     class Meta:
         verbose_name = 'Ингредиенты в рецепте'
         verbose_name_plural = 'Ингредиенты в рецепте'
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'ingredient'],
+                                    name='unique_ingredient_recipe')
+        ]
 
     def __str__(self):
         return f'{self.ingredient} {self.recipe}'
@@ -159,6 +264,14 @@ class TagRecipe(models.Model):
     class Meta:
         verbose_name = 'Теги рецепта'
         verbose_name_plural = 'Теги рецепта'
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'tag'],
+                                    name='unique_tag_recipe')
+        ]
+        indexes = [
+            models.Index(fields=['tag', 'recipe'],
+                         name='tagrecipe_tag_recipe_idx')
+        ]
 
     def __str__(self):
         return f'{self.tag} {self.recipe}'
@@ -189,6 +302,10 @@ class ShoppingCart(models.Model):
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='unique_shoppingcart')
         ]
+        indexes = [
+            models.Index(fields=['user', '-id'],
+                         name='shoppingcart_user_id_idx')
+        ]
 
     def __str__(self):
         return f'{self.user} {self.recipe}'
@@ -218,6 +335,9 @@ class Favorite(models.Model):
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='unique_favorite')
         ]
+        indexes = [
+            models.Index(fields=['user', '-id'], name='favorite_user_id_idx')
+        ]
 
     def __str__(self):
         return f'{self.recipe} {self.user}'
@@ -247,6 +367,105 @@ class Subscribe(models.Model):
             models.UniqueConstraint(fields=['user', 'following'],
                                     name='unique_subscribe')
         ]
+        indexes = [
+            models.Index(fields=['user', '-id'], name='subscribe_user_id_idx')
+        ]
 
     def __str__(self):
         return f'{self.user} {self.following}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в заранее собранной ленте подписчика."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта'
+    )
+
+    class Meta:
+        ordering = ('-pub_date', '-recipe')
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_feed_entry')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='feed_user_pub_date_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.recipe}'
+
+
+class ShoppingListJob(models.Model):
+    """Задание на фоновую сборку списка покупок."""
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_jobs',
+        verbose_name='Пользователь',
+        help_text='Выберите пользователя'
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        verbose_name='Статус'
+    )
+    version = models.CharField(
+        max_length=64,
+        verbose_name='Версия корзины'
+    )
+    file = models.FileField(
+        upload_to='shopping_lists/',
+        blank=True,
+        verbose_name='Файл'
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Ошибка'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+    finished = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дата завершения'
+    )
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = 'Сборка списка покупок'
+        verbose_name_plural = 'Сборки списков покупок'
+
+    def __str__(self):
+        return f'{self.user} {self.status}'
@@ -0,0 +1,148 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import IngredientRecipe
+
+TABLE = 'recipes_recipe_search'
+KEYS = {'postgresql': 'recipe_id', 'sqlite': 'rowid'}
+SOURCE = (
+    'FROM recipes_recipe recipe '
+    'LEFT JOIN recipes_ingredientrecipe link ON link.recipe_id = recipe.id '
+    'LEFT JOIN recipes_ingredient ingredient '
+    'ON ingredient.id = link.ingredient_id '
+    'WHERE {where} GROUP BY recipe.id')
+# Название весомее продуктов, продукты весомее описания.
+INSERT_SQL = {
+    'postgresql': (
+        f'INSERT INTO {TABLE} (recipe_id, document) SELECT recipe.id, '
+        "setweight(to_tsvector(%s, recipe.name), 'A') || "
+        'setweight(to_tsvector(%s, '
+        "COALESCE(string_agg(ingredient.name, ' '), '')), 'B') || "
+        "setweight(to_tsvector(%s, recipe.text), 'C') " + SOURCE),
+    'sqlite': (
+        f'INSERT INTO {TABLE} (rowid, name, ingredients, text) '
+        'SELECT recipe.id, recipe.name, '
+        "COALESCE(group_concat(ingredient.name, ' '), ''), recipe.text "
+        + SOURCE),
+}
+MATCH_SQL = {
+    'postgresql': (f'SELECT recipe_id FROM {TABLE} '
+                   'WHERE document @@ websearch_to_tsquery(%s, %s)'),
+    'sqlite': f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s',
+}
+RANK_SQL = {
+    'postgresql': (f'SELECT ts_rank(document, websearch_to_tsquery(%s, %s)) '
+                   f'FROM {TABLE} WHERE recipe_id = recipes_recipe.id'),
+    'sqlite': (f'SELECT -bm25({TABLE}, 10.0, 4.0, 1.0) FROM {TABLE} '
+               f'WHERE {TABLE} MATCH %s AND rowid = recipes_recipe.id'),
+}
+INGREDIENT_RECIPES = (
+    'recipe.id IN (SELECT recipe_id FROM recipes_ingredientrecipe '
+    'WHERE ingredient_id = %s)')
+
+
+class RawSubquery(RawSQL):
+    """Подзапрос для __in: Django 2.2 сам берёт его в скобки, а вторые
+    скобки превратили бы его в скалярный."""
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def is_supported():
+    """Таблица поиска есть только на Postgres и SQLite (миграция 0013)."""
+    return connection.vendor in KEYS
+
+
+def config_params():
+    if connection.vendor == 'postgresql':
+        return (settings.RECIPE_SEARCH_CONFIG,) * 3
+    return ()
+
+
+def query_params(query):
+    """Параметры запроса; в SQLite каждое слово ищется как префикс."""
+    if connection.vendor == 'postgresql':
+        return settings.RECIPE_SEARCH_CONFIG, query
+    words = re.findall(r'\w+', query.lower())
+    if not words:
+        return None
+    return (' '.join(f'"{word}"*' for word in words),)
+
+
+def update(where, params=()):
+    """Пересобирает документы рецептов, подходящих под условие."""
+    if not is_supported():
+        return
+    key = KEYS[connection.vendor]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE} WHERE {key} IN '
+            f'(SELECT recipe.id FROM recipes_recipe recipe WHERE {where})',
+            params)
+        cursor.execute(
+            INSERT_SQL[connection.vendor].format(where=where),
+            config_params() + tuple(params))
+
+
+def index(recipe_ids):
+    recipe_ids = tuple(recipe_ids)
+    if recipe_ids:
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        update(f'recipe.id IN ({placeholders})', recipe_ids)
+
+
+def index_ingredient(ingredient_id):
+    """Документы рецептов, в которых есть продукт."""
+    update(INGREDIENT_RECIPES, (ingredient_id,))
+
+
+def remove(recipe_ids):
+    recipe_ids = tuple(recipe_ids)
+    if not recipe_ids or not is_supported():
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE} '
+            f'WHERE {KEYS[connection.vendor]} IN ({placeholders})',
+            recipe_ids)
+
+
+def rebuild():
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    update('1 = 1')
+
+
+def match(queryset, query):
+    """Рецепты, документ которых подходит под запрос."""
+    if not is_supported():
+        # Без таблицы поиска запрос ищется как подстрока.
+        return queryset.filter(
+            Q(name__icontains=query) | Q(text__icontains=query)
+            | Q(id__in=IngredientRecipe.objects.filter(
+                ingredient__name__icontains=query).values('recipe_id')))
+    params = query_params(query)
+    if params is None:
+        return queryset.none()
+    return queryset.filter(
+        id__in=RawSubquery(MATCH_SQL[connection.vendor], params))
+
+
+def ranked(queryset, query):
+    """Сначала рецепты с большим весом совпадений, затем новые."""
+    if not is_supported():
+        return queryset
+    params = query_params(query)
+    if params is None:
+        return queryset
+    return queryset.annotate(
+        search_rank=RawSQL(RANK_SQL[connection.vendor], params)
+    ).order_by('-search_rank', '-pub_date', '-id')
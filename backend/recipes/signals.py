@@ -0,0 +1,89 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from users.models import User
+
+from . import feed, search
+from .counters import change
+from .models import Ingredient, Recipe, Tag
+from .versions import (INGREDIENTS, RECIPES, TAGS, USERS, bump_on_commit,
+                       recipe_version)
+
+
+# Документы поиска пересобираются после фиксации, раньше смены версий:
+# обработчики on_commit выполняются в порядке регистрации, и кэш ответов
+# не успеет сохранить старую выдачу под новой версией.
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(partial(search.index_ingredient, instance.pk))
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(instance, **kwargs):
+    # После удаления связей уже не узнать, в каких рецептах был продукт.
+    recipes = list(instance.ingredientrecipes.values_list(
+        'recipe_id', flat=True))
+    transaction.on_commit(partial(search.index, recipes))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, **kwargs):
+    # Продукты сохраняются после рецепта, поэтому и документ собирается
+    # после фиксации транзакции.
+    transaction.on_commit(partial(search.index, (instance.pk,)))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(**kwargs):
+    bump_on_commit(INGREDIENTS)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(**kwargs):
+    # Иначе get_tag_ids закэширует старые слаги под новой версией.
+    bump_on_commit(TAGS)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    # Теги и продукты рецепта меняются только вместе с самим рецептом,
+    # свои обработчики у связей отключили бы быстрое каскадное удаление.
+    bump_on_commit(RECIPES, recipe_version(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def user_changed(created, update_fields, **kwargs):
+    # Новый автор попадает в ответы только вместе со своим рецептом.
+    if not created and update_fields != frozenset(('last_login',)):
+        bump_on_commit(USERS)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        change(User, instance.author_id, 'recipes_count', 1)
+        feed.published(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    change(User, instance.author_id, 'recipes_count', -1)
+    search.remove((instance.pk,))
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(instance, **kwargs):
+    # Подписки на пользователя удаляются каскадом одним DELETE, поэтому
+    # счётчики подписчиков уменьшаются заранее одним UPDATE. Записи их
+    # лент с рецептами автора удалятся каскадом вместе с рецептами.
+    User.objects.filter(
+        follower__following=instance, subscriptions_count__gt=0,
+    ).update(subscriptions_count=F('subscriptions_count') - 1)
+    # Избранное пользователя тоже удаляется каскадом.
+    Recipe.objects.filter(
+        favorites__user=instance, favorites_count__gt=0,
+    ).update(favorites_count=F('favorites_count') - 1)
@@ -0,0 +1,53 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+INGREDIENTS = 'ingredients'
+RECIPES = 'recipes'
+TAGS = 'tags'
+USERS = 'users'
+
+
+def _key(name):
+    return f'version:{name}'
+
+
+def recipe_version(pk):
+    return f'recipe:{pk}'
+
+
+def get_version(name):
+    """Текущая версия набора данных, общая для всех процессов через кэш."""
+    return cache.get_or_set(_key(name), time.time_ns, timeout=None)
+
+
+def get_versions(names):
+    """Версии нескольких наборов данных одним обращением к кэшу."""
+    keys = [_key(name) for name in names]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_version(name):
+    """Сбрасывает всё, что было закэшировано под прежней версией.
+
+    Новая версия — текущее время, а не incr: в файловом кэше incr не
+    атомарен, и две одновременные записи получили бы одну версию.
+    """
+    version = time.time_ns()
+    cache.set(_key(name), version, timeout=None)
+    return version
+
+
+def bump_on_commit(*names):
+    """Версии меняются после фиксации, иначе параллельный запрос успеет
+    закэшировать старые данные под новой версией."""
+    def bump():
+        for name in names:
+            bump_version(name)
+    transaction.on_commit(bump)
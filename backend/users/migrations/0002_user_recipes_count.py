@@ -0,0 +1,30 @@
+# Generated by Django 2.2.19 on 2026-10-18 16:46
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_recipes(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    recipes = Recipe.objects.filter(author=OuterRef('pk')).order_by(
+        ).values('author').annotate(total=Count('id')).values('total')
+    User.objects.update(recipes_count=Coalesce(Subquery(recipes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('recipes', '0007_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество рецептов'),
+        ),
+        migrations.RunPython(count_recipes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.19 on 2026-10-18 16:50
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subscriptions(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Subscribe = apps.get_model('recipes', 'Subscribe')
+    subscriptions = Subscribe.objects.filter(user=OuterRef('pk')).order_by(
+        ).values('user').annotate(total=Count('id')).values('total')
+    User.objects.update(
+        subscriptions_count=Coalesce(Subquery(subscriptions), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_recipes_count'),
+        ('recipes', '0007_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='subscriptions_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подписок'),
+        ),
+        migrations.RunPython(count_subscriptions, migrations.RunPython.noop),
+    ]